@@ -117,18 +117,20 @@ class SharedSystemMigration:
                 # Migrar medicamentos/recordatorios
                 try:
                     cursor.execute("SELECT * FROM reminders")
-                    for row in cursor.fetchall():
-                        times_list = row['times'].split(',') if row['times'] else []
-                        days_list = row['days_of_week'].split(',') if row['days_of_week'] else []
-                        
-                        shared_data_manager.add_medication(
-                            name=row['medication_name'],
-                            quantity=row.get('cantidad', ''),
-                            prescription=row.get('prescripcion', ''),
-                            times=times_list,
-                            days=days_list,
-                            photo_path=row.get('photo_path', '')
-                        )
+                    # Todas las filas de la tabla en una sola transacción
+                    with shared_data_manager.batch() as batch:
+                        for row in cursor.fetchall():
+                            times_list = row['times'].split(',') if row['times'] else []
+                            days_list = row['days_of_week'].split(',') if row['days_of_week'] else []
+                            
+                            batch.add_medication(
+                                name=row['medication_name'],
+                                quantity=row.get('cantidad', ''),
+                                prescription=row.get('prescripcion', ''),
+                                times=times_list,
+                                days=days_list,
+                                photo_path=row.get('photo_path', '')
+                            )
                     logger.info("Medicamentos legacy migrados")
                 except sqlite3.OperationalError:
                     logger.info("Tabla de medicamentos legacy no encontrada")
@@ -136,15 +138,17 @@ class SharedSystemMigration:
                 # Migrar tareas si existe la tabla
                 try:
                     cursor.execute("SELECT * FROM tasks")
-                    for row in cursor.fetchall():
-                        times_list = row['times'].split(',') if row['times'] else []
-                        days_list = row['days_of_week'].split(',') if row['days_of_week'] else []
-                        
-                        shared_data_manager.add_task(
-                            name=row['task_name'],
-                            times=times_list,
-                            days=days_list
-                        )
+                    # Todas las filas de la tabla en una sola transacción
+                    with shared_data_manager.batch() as batch:
+                        for row in cursor.fetchall():
+                            times_list = row['times'].split(',') if row['times'] else []
+                            days_list = row['days_of_week'].split(',') if row['days_of_week'] else []
+                            
+                            batch.add_task(
+                                name=row['task_name'],
+                                times=times_list,
+                                days=days_list
+                            )
                     logger.info("Tareas legacy migradas")
                 except sqlite3.OperationalError:
                     logger.info("Tabla de tareas legacy no encontrada")
@@ -152,16 +156,18 @@ class SharedSystemMigration:
                 # Migrar contactos si existe la tabla
                 try:
                     cursor.execute("SELECT * FROM contacts")
-                    for row in cursor.fetchall():
-                        aliases_list = row['aliases'].split(',') if row['aliases'] else []
-                        
-                        shared_data_manager.add_contact(
-                            display_name=row['display_name'],
-                            aliases=aliases_list,
-                            platform=row.get('platform', 'telegram'),
-                            details=row['contact_details'],
-                            is_emergency=bool(row.get('is_emergency', False))
-                        )
+                    # Todas las filas de la tabla en una sola transacción
+                    with shared_data_manager.batch() as batch:
+                        for row in cursor.fetchall():
+                            aliases_list = row['aliases'].split(',') if row['aliases'] else []
+                            
+                            batch.add_contact(
+                                display_name=row['display_name'],
+                                aliases=aliases_list,
+                                platform=row.get('platform', 'telegram'),
+                                details=row['contact_details'],
+                                is_emergency=bool(row.get('is_emergency', False))
+                            )
                     logger.info("Contactos legacy migrados")
                 except sqlite3.OperationalError:
                     logger.info("Tabla de contactos legacy no encontrada")
@@ -214,19 +220,21 @@ class SharedSystemMigration:
                     try:
                         cursor.execute("SELECT * FROM reminders WHERE type = 'medication' AND is_active = TRUE")
                         migrated_meds = 0
-                        for row in cursor.fetchall():
-                            times_list = json.loads(row['times']) if row['times'] else []
-                            days_list = json.loads(row['days']) if row['days'] else []
-                            
-                            shared_data_manager.add_medication(
-                                name=row['name'],
-                                quantity=row['quantity'] or '',
-                                prescription=row['prescription'] or '',
-                                times=times_list,
-                                days=days_list,
-                                photo_path=row['photo_path'] or ''
-                            )
-                            migrated_meds += 1
+                        # Todas las filas de la tabla en una sola transacción
+                        with shared_data_manager.batch() as batch:
+                            for row in cursor.fetchall():
+                                times_list = json.loads(row['times']) if row['times'] else []
+                                days_list = json.loads(row['days']) if row['days'] else []
+                                
+                                batch.add_medication(
+                                    name=row['name'],
+                                    quantity=row['quantity'] or '',
+                                    prescription=row['prescription'] or '',
+                                    times=times_list,
+                                    days=days_list,
+                                    photo_path=row['photo_path'] or ''
+                                )
+                                migrated_meds += 1
                         logger.info(f"Medicamentos migrados de {username}: {migrated_meds}")
                     except sqlite3.OperationalError:
                         logger.info(f"Tabla de medicamentos no encontrada en {username}")
@@ -235,16 +243,18 @@ class SharedSystemMigration:
                     try:
                         cursor.execute("SELECT * FROM reminders WHERE type = 'task' AND is_active = TRUE")
                         migrated_tasks = 0
-                        for row in cursor.fetchall():
-                            times_list = json.loads(row['times']) if row['times'] else []
-                            days_list = json.loads(row['days']) if row['days'] else []
-                            
-                            shared_data_manager.add_task(
-                                name=row['name'],
-                                times=times_list,
-                                days=days_list
-                            )
-                            migrated_tasks += 1
+                        # Todas las filas de la tabla en una sola transacción
+                        with shared_data_manager.batch() as batch:
+                            for row in cursor.fetchall():
+                                times_list = json.loads(row['times']) if row['times'] else []
+                                days_list = json.loads(row['days']) if row['days'] else []
+                                
+                                batch.add_task(
+                                    name=row['name'],
+                                    times=times_list,
+                                    days=days_list
+                                )
+                                migrated_tasks += 1
                         logger.info(f"Tareas migradas de {username}: {migrated_tasks}")
                     except sqlite3.OperationalError:
                         logger.info(f"Tabla de tareas no encontrada en {username}")
@@ -253,17 +263,19 @@ class SharedSystemMigration:
                     try:
                         cursor.execute("SELECT * FROM contacts WHERE is_active = TRUE")
                         migrated_contacts = 0
-                        for row in cursor.fetchall():
-                            aliases_list = json.loads(row['aliases']) if row['aliases'] else []
-                            
-                            shared_data_manager.add_contact(
-                                display_name=row['display_name'],
-                                aliases=aliases_list,
-                                platform=row['platform'],
-                                details=row['details'],
-                                is_emergency=bool(row['is_emergency'])
-                            )
-                            migrated_contacts += 1
+                        # Todas las filas de la tabla en una sola transacción
+                        with shared_data_manager.batch() as batch:
+                            for row in cursor.fetchall():
+                                aliases_list = json.loads(row['aliases']) if row['aliases'] else []
+                                
+                                batch.add_contact(
+                                    display_name=row['display_name'],
+                                    aliases=aliases_list,
+                                    platform=row['platform'],
+                                    details=row['details'],
+                                    is_emergency=bool(row['is_emergency'])
+                                )
+                                migrated_contacts += 1
                         logger.info(f"Contactos migrados de {username}: {migrated_contacts}")
                     except sqlite3.OperationalError:
                         logger.info(f"Tabla de contactos no encontrada en {username}")
@@ -367,9 +379,10 @@ class SharedSystemMigration:
             logger.info("Verificando migración...")
             
             # Verificar BD compartida
-            medications = shared_data_manager.list_medications()
-            tasks = shared_data_manager.list_tasks()
-            contacts = shared_data_manager.list_contacts()
+            dashboard = shared_data_manager.list_dashboard()
+            medications = dashboard['medications']
+            tasks = dashboard['tasks']
+            contacts = dashboard['contacts']
             
             logger.info(f"BD compartida - Medicamentos: {len(medications)}, Tareas: {len(tasks)}, Contactos: {len(contacts)}")
             
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Migration: Empaquetar horarios y días de la BD compartida
+
+Reescribe las columnas times/days de las tablas reminders y tasks de
+shared_data.db desde arrays JSON al formato binario empaquetado que usa
+SharedDataManager (uint16 por horario y máscara de bits para los días).
+Las filas cuyo contenido no encaja en ese formato se dejan en JSON.
+
+Autor: Asistente Kata
+Fecha: 2025-08-25
+Versión: 1.0.0
+"""
+
+import sqlite3
+import sys
+import json
+import logging
+from pathlib import Path
+
+# Agregar path del proyecto
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from database.models.shared_data_manager import pack_times, pack_days
+
+logger = logging.getLogger(__name__)
+
+def pack_schedule_columns(db_path: str) -> bool:
+    """
+    Convierte las columnas times/days que siguen en JSON al formato empaquetado.
+    
+    Args:
+        db_path: Ruta a shared_data.db
+        
+    Returns:
+        bool: True si la migración terminó correctamente
+    """
+    try:
+        with sqlite3.connect(db_path) as conn:
+            cursor = conn.cursor()
+            converted = 0
+            
+            for table in ('reminders', 'tasks'):
+                cursor.execute(f"""
+                    SELECT id, times, days FROM {table}
+                    WHERE typeof(times) = 'text' OR typeof(days) = 'text'
+                """)
+                updates = []
+                for row_id, times, days in cursor.fetchall():
+                    # Solo listas: pack_* dejan en None (JSON) los elementos
+                    # que no son cadenas o no se leerían de vuelta igual
+                    if isinstance(times, str):
+                        values = json.loads(times)
+                        if isinstance(values, list):
+                            times = pack_times(values) or times
+                    if isinstance(days, str):
+                        values = json.loads(days)
+                        if isinstance(values, list):
+                            days = pack_days(values) or days
+                    updates.append((times, days, row_id))
+                
+                cursor.executemany(f"UPDATE {table} SET times = ?, days = ? WHERE id = ?", updates)
+                converted += len(updates)
+            
+            conn.commit()
+            logger.info(f"Horarios empaquetados en {db_path}: {converted} filas revisadas")
+            return True
+            
+    except Exception as e:
+        logger.error(f"Error empaquetando horarios en {db_path}: {e}")
+        return False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    base_path = Path(__file__).parent.parent.parent
+    pack_schedule_columns(str(base_path / "data" / "system" / "shared_data.db"))
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Preferencias técnicas por defecto - Comunes a todos los usuarios
+
+Sustituye a default_preferences.json: al ser un módulo Python, el contenido
+se carga una sola vez desde el bytecode cacheado (.pyc) en lugar de leer y
+parsear el JSON.
+
+Las preferencias personales de cada usuario se guardan en su propia BD;
+aquí solo están las categorías técnicas.
+
+Autor: Asistente Kata
+Versión: 1.0.0
+"""
+
+DEFAULT_PREFERENCES: dict = {
+    'ia_generativa': {
+        'habilitada': True,
+        'confianza_minima_clasica': 0.85,
+        'temperatura': 0.3,
+        'max_tokens_respuesta': 150
+    },
+    'asistente': {
+        'personalidad': 'amigable_profesional',
+        'usar_emojis': False,
+        'respuestas_cortas': True
+    },
+    'comandos_clasicos': {
+        'siempre_preferir': ['recordatorio', 'medicacion', 'contacto_emergencia', 'fecha', 'hora', 'enchufe'],
+        'nunca_derivar_ia': ['emergencia', 'medicacion_critica', 'sistema_apagar']
+    }
+}
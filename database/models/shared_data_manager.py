@@ -20,12 +20,413 @@ Versión: 2.0.0
 import sqlite3
 import json
 import logging
+import struct
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+from typing import List, Dict, Any, Iterator, Optional
 
 logger = logging.getLogger(__name__)
 
+# PRAGMAs que aplican por conexión (journal_mode=WAL es persistente en el archivo)
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Versión del esquema guardada en PRAGMA user_version. Incrementarla cuando
+# cambie SCHEMA_SQL para que las BD existentes vuelvan a ejecutarlo.
+SCHEMA_VERSION = 1
+
+# Esquema completo de la BD compartida: se ejecuta de una vez con executescript
+# (un solo análisis y una sola transacción)
+SCHEMA_SQL = f"""
+BEGIN;
+
+    -- Tabla de medicamentos/recordatorios
+    CREATE TABLE IF NOT EXISTS reminders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        quantity TEXT DEFAULT '',
+        prescription TEXT DEFAULT '',
+        times TEXT NOT NULL,  -- BLOB empaquetado o JSON array de horarios
+        days TEXT NOT NULL,   -- BLOB empaquetado o JSON array de días
+        photo_path TEXT DEFAULT '',
+        is_active BOOLEAN DEFAULT TRUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Tabla de tareas
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        times TEXT NOT NULL,  -- BLOB empaquetado o JSON array de horarios
+        days TEXT NOT NULL,   -- BLOB empaquetado o JSON array de días
+        is_active BOOLEAN DEFAULT TRUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Tabla de contactos
+    CREATE TABLE IF NOT EXISTS contacts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        display_name TEXT NOT NULL,
+        aliases TEXT NOT NULL,    -- JSON array de aliases
+        platform TEXT NOT NULL,
+        details TEXT NOT NULL,    -- Chat ID, teléfono, etc.
+        telegram_chat_id TEXT,    -- Campo específico para chat_id de Telegram
+        is_emergency BOOLEAN DEFAULT FALSE,
+        is_active BOOLEAN DEFAULT TRUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Tabla de configuraciones globales
+    CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        category TEXT DEFAULT 'general',
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Tabla de mensajes recibidos
+    CREATE TABLE IF NOT EXISTS received_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        contact_id INTEGER NOT NULL,
+        message_text TEXT NOT NULL,
+        telegram_message_id INTEGER UNIQUE,
+        sender_chat_id TEXT NOT NULL,
+        received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_read BOOLEAN DEFAULT FALSE,
+        is_notified BOOLEAN DEFAULT FALSE,
+        FOREIGN KEY (contact_id) REFERENCES contacts (id)
+    );
+
+    -- Índices para las consultas frecuentes (listados activos,
+    -- búsqueda de contacto por nombre y mensajes no leídos)
+    CREATE INDEX IF NOT EXISTS idx_reminders_active_created
+        ON reminders (is_active, created_at DESC);
+    CREATE INDEX IF NOT EXISTS idx_tasks_active_created
+        ON tasks (is_active, created_at DESC);
+    CREATE INDEX IF NOT EXISTS idx_contacts_active_name
+        ON contacts (is_active, display_name);
+    CREATE INDEX IF NOT EXISTS idx_contacts_display_name
+        ON contacts (display_name);
+    -- Índice parcial: solo contiene los mensajes pendientes. Las
+    -- consultas deben filtrar con "is_read = FALSE" para usarlo.
+    CREATE INDEX IF NOT EXISTS idx_messages_unread
+        ON received_messages (is_read, received_at)
+        WHERE is_read = FALSE;
+
+    -- Insertar configuraciones por defecto
+    INSERT OR IGNORE INTO settings (key, value, category)
+    VALUES ('voice_name', 'es-US-Neural2-A', 'tts');
+    INSERT OR IGNORE INTO settings (key, value, category)
+    VALUES ('app_theme', 'dark', 'ui');
+
+PRAGMA user_version = {SCHEMA_VERSION};
+
+COMMIT;
+"""
+
+# Tamaño de la caché de sentencias preparadas por conexión
+STATEMENT_CACHE_SIZE = 256
+
+# Ventana (segundos) que espera add_message_async para agrupar una ráfaga de
+# mensajes en una sola transacción
+MESSAGE_FLUSH_INTERVAL = 0.02
+
+# === SENTENCIAS SQL ===
+# Definidas a nivel de módulo para que cada conexión reutilice la sentencia
+# preparada de su caché en lugar de volver a compilarla.
+
+SQL_LIST_MEDICATIONS = """
+    SELECT id, name, quantity, prescription, times, days, photo_path, created_at
+    FROM reminders
+    WHERE is_active = TRUE
+    ORDER BY created_at DESC
+"""
+
+SQL_INSERT_REMINDER = """
+    INSERT INTO reminders (name, quantity, prescription, times, days, photo_path)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+SQL_SOFT_DELETE_REMINDER = """
+    UPDATE reminders
+    SET is_active = FALSE, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+"""
+
+SQL_LIST_TASKS = """
+    SELECT id, name, times, days, created_at
+    FROM tasks
+    WHERE is_active = TRUE
+    ORDER BY created_at DESC
+"""
+
+SQL_INSERT_TASK = """
+    INSERT INTO tasks (name, times, days)
+    VALUES (?, ?, ?)
+"""
+
+SQL_SOFT_DELETE_TASK = """
+    UPDATE tasks
+    SET is_active = FALSE, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+"""
+
+# Los aliases (array JSON) se devuelven ya como "a,b,c" para no decodificarlos en Python
+SQL_LIST_CONTACTS = """
+    SELECT id, display_name,
+           (SELECT group_concat(value, ',') FROM json_each(aliases)) AS aliases_csv,
+           platform, details, is_emergency, created_at
+    FROM contacts
+    WHERE is_active = TRUE
+    ORDER BY display_name
+"""
+
+SQL_INSERT_CONTACT = """
+    INSERT INTO contacts (display_name, aliases, platform, details, telegram_chat_id, is_emergency)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+SQL_SOFT_DELETE_CONTACT = """
+    UPDATE contacts
+    SET is_active = FALSE, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+"""
+
+SQL_LOAD_SETTINGS = "SELECT key, value, category FROM settings"
+
+SQL_UPSERT_SETTING = """
+    INSERT OR REPLACE INTO settings (key, value, category, updated_at)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+"""
+
+# Busca el contacto por nombre y completa su telegram_chat_id si falta, en una
+# sola sentencia. No hay UNIQUE sobre display_name (los contactos eliminados
+# conservan su nombre), así que se toma el primero, como hacía el SELECT previo.
+SQL_TOUCH_MESSAGE_CONTACT = """
+    UPDATE contacts
+    SET telegram_chat_id = COALESCE(telegram_chat_id, ?),
+        updated_at = CASE WHEN telegram_chat_id IS NULL THEN CURRENT_TIMESTAMP ELSE updated_at END
+    WHERE id = (SELECT id FROM contacts WHERE display_name = ? ORDER BY id LIMIT 1)
+    RETURNING id
+"""
+
+SQL_INSERT_MESSAGE_CONTACT = """
+    INSERT INTO contacts (display_name, aliases, platform, details, telegram_chat_id, is_emergency, is_active)
+    VALUES (?, ?, ?, ?, ?, FALSE, TRUE)
+"""
+
+# Telegram puede reenviar la misma actualización: los duplicados no devuelven fila
+SQL_INSERT_MESSAGE = """
+    INSERT INTO received_messages
+    (contact_id, message_text, telegram_message_id, sender_chat_id, is_read, is_notified)
+    VALUES (?, ?, ?, ?, FALSE, FALSE)
+    ON CONFLICT (telegram_message_id) DO NOTHING
+    RETURNING id
+"""
+
+SQL_UNREAD_MESSAGES = """
+    SELECT
+        m.id,
+        m.message_text,
+        m.received_at,
+        c.display_name as contact_name
+    FROM received_messages m
+    JOIN contacts c ON m.contact_id = c.id
+    WHERE m.is_read = FALSE
+    ORDER BY m.received_at ASC, m.id ASC
+    LIMIT ?
+"""
+
+# Los IDs se pasan como un único array JSON: una sola sentencia preparada
+# sirve para cualquier tamaño de lote y no hay límite de parámetros
+SQL_DELETE_MESSAGES = """
+    DELETE FROM received_messages
+    WHERE id IN (SELECT value FROM json_each(?))
+"""
+
+# "is_read = FALSE" (no "= 0") para que el planificador use idx_messages_unread
+SQL_UNREAD_COUNT = "SELECT COUNT(1) FROM received_messages WHERE is_read = FALSE"
+
+SQL_MARK_NOTIFIED = """
+    UPDATE received_messages
+    SET is_notified = TRUE
+    WHERE id = ?
+"""
+
+# === FORMATO EMPAQUETADO DE HORARIOS Y DÍAS ===
+# times se guarda como BLOB de uint16 little-endian (minutos desde medianoche)
+# y days como BLOB de un byte: bits 0-6 = lunes..domingo, bit 7 = los días
+# se escribieron por nombre ('mon', 'tue', ...) en lugar de por número.
+# Solo se empaquetan los valores que se leen de vuelta exactamente igual
+# ("HH:MM" con ceros y días en orden ascendente, sin repetir); el resto se
+# sigue guardando como JSON,
+# y las filas antiguas en JSON se leen igual (ver migrations/pack_shared_schedules.py).
+
+DAY_NAMES = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+_DAY_NAME_FLAG = 0x80
+_DAY_INDEX = {**{str(i): i for i in range(7)}, **{name: i for i, name in enumerate(DAY_NAMES)}}
+
+# Etiquetas precalculadas: minuto del día -> "HH:MM" y máscara -> "0,1,2" / "mon,tue"
+_MINUTE_LABELS = tuple(f"{m // 60:02d}:{m % 60:02d}" for m in range(24 * 60))
+_DAY_MASK_LABELS = tuple(
+    ','.join((DAY_NAMES[i] if mask & _DAY_NAME_FLAG else str(i))
+             for i in range(7) if mask & (1 << i))
+    for mask in range(256)
+)
+
+
+def pack_times(times: List[str]) -> Optional[bytes]:
+    """
+    Empaqueta horarios "HH:MM"; devuelve None si alguno no tiene exactamente
+    ese formato (por ejemplo "8:00"), para que se guarde tal cual en JSON.
+    """
+    minutes = []
+    for value in times:
+        if value.__class__ is not str:
+            return None
+        hour, sep, minute = value.partition(':')
+        if not (sep and hour.isdigit() and minute.isdigit()):
+            return None
+        hour, minute = int(hour), int(minute)
+        if hour > 23 or minute > 59:
+            return None
+        m = hour * 60 + minute
+        if _MINUTE_LABELS[m] != value:
+            return None
+        minutes.append(m)
+    return struct.pack(f'<{len(minutes)}H', *minutes)
+
+
+def pack_days(days: List[str]) -> Optional[bytes]:
+    """
+    Empaqueta días como máscara de bits; devuelve None si no es posible sin
+    cambiar el valor leído (días desordenados o repetidos, mayúsculas...).
+    """
+    if not days or days[0] not in _DAY_INDEX:
+        return None
+    by_name = days[0] in DAY_NAMES
+    mask = _DAY_NAME_FLAG if by_name else 0
+    previous = -1
+    for value in days:
+        index = _DAY_INDEX.get(value) if value.__class__ is str else None
+        if index is None or index <= previous or (value in DAY_NAMES) != by_name:
+            return None
+        mask |= 1 << index
+        previous = index
+    return bytes((mask,))
+
+
+def format_times(value) -> str:
+    """Convierte la columna times (BLOB empaquetado o JSON) a "HH:MM,HH:MM"."""
+    if not value:
+        return ''
+    if isinstance(value, bytes):
+        return ','.join([_MINUTE_LABELS[m] for (m,) in struct.iter_unpack('<H', value)])
+    return ','.join(json.loads(value))
+
+
+def format_days(value) -> str:
+    """Convierte la columna days (BLOB empaquetado o JSON) a "0,1,2" o "mon,tue"."""
+    if not value:
+        return ''
+    if isinstance(value, bytes):
+        return _DAY_MASK_LABELS[value[0]]
+    return ','.join(json.loads(value))
+
+
+# Errores al decodificar una fila con datos corruptos (BLOB truncado, JSON
+# inválido, valores de tipo inesperado). La fila se omite al listar
+_ROW_DECODE_ERRORS = (struct.error, IndexError, ValueError, TypeError)
+
+
+def _schedule_params(times: Optional[List[str]], days: Optional[List[str]]) -> tuple:
+    """Valores de las columnas times/days: empaquetados si es posible, si no JSON."""
+    times = times or []
+    days = days or []
+    packed_times = pack_times(times)
+    packed_days = pack_days(days)
+    return (json.dumps(times) if packed_times is None else packed_times,
+            json.dumps(days) if packed_days is None else packed_days)
+
+
+# Claves de cada contacto (formato legacy y nuevo). Filas de SQL_LIST_CONTACTS:
+# (id, display_name, aliases_csv, platform, details, is_emergency, created_at)
+_CONTACT_KEYS = ('id', 'display_name', 'displayName', 'aliases', 'platform', 'details',
+                 'contact_details', 'is_emergency', 'isEmergency', 'created_at')
+
+def _medication_params(name: str, quantity: str = "", prescription: str = "",
+                       times: List[str] = None, days: List[str] = None,
+                       photo_path: str = "") -> tuple:
+    """Construye los parámetros de SQL_INSERT_REMINDER."""
+    return (name, quantity, prescription, *_schedule_params(times, days), photo_path)
+
+
+def _task_params(name: str, times: List[str] = None, days: List[str] = None) -> tuple:
+    """Construye los parámetros de SQL_INSERT_TASK."""
+    return (name, *_schedule_params(times, days))
+
+
+def _contact_params(display_name: str, aliases: List[str], platform: str, details: str,
+                    telegram_chat_id: str = None, is_emergency: bool = False) -> tuple:
+    """Construye los parámetros de SQL_INSERT_CONTACT."""
+    return (display_name, json.dumps(aliases), platform, details, telegram_chat_id, is_emergency)
+
+
+class SharedDBUnavailable(Exception):
+    """La base de datos compartida no se puede abrir."""
+
+class _ThreadConnection:
+    """
+    Conexión de un hilo, guardada en su threading.local. Cuando el hilo
+    termina se libera el thread-local y el finalizador cierra la conexión
+    (los servidores con un hilo por request no acumulan conexiones).
+    """
+    __slots__ = ('conn', '_finalizer', '__weakref__')
+    
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self._finalizer = weakref.finalize(self, conn.close)
+    
+    def close(self):
+        """Cierra la conexión ahora (solo la primera llamada tiene efecto)."""
+        self._finalizer()
+
+class SharedDataBatch:
+    """
+    Escrituras agrupadas en una única transacción de la BD compartida.
+    
+    Se obtiene con SharedDataManager.batch(); las operaciones no confirman
+    por sí mismas, la transacción se confirma al salir del bloque.
+    """
+    
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+    
+    def add_medication(self, *args, **kwargs):
+        """Agrega un medicamento (mismos argumentos que SharedDataManager.add_medication)."""
+        self.conn.execute(SQL_INSERT_REMINDER, _medication_params(*args, **kwargs))
+    
+    def add_task(self, *args, **kwargs):
+        """Agrega una tarea (mismos argumentos que SharedDataManager.add_task)."""
+        self.conn.execute(SQL_INSERT_TASK, _task_params(*args, **kwargs))
+    
+    def add_contact(self, *args, **kwargs):
+        """Agrega un contacto (mismos argumentos que SharedDataManager.add_contact)."""
+        self.conn.execute(SQL_INSERT_CONTACT, _contact_params(*args, **kwargs))
+
 class SharedDataManager:
     """
     Gestor de datos compartidos globalmente entre todos los usuarios.
@@ -55,147 +456,211 @@ class SharedDataManager:
         # Inicializar base de datos compartida
         self._init_shared_database()
         
+        # Conexiones reutilizables (una por hilo). Solo el thread-local las
+        # mantiene vivas; el WeakSet permite cerrarlas en close_all
+        self._tls = threading.local()
+        self._connections: "weakref.WeakSet[_ThreadConnection]" = weakref.WeakSet()
+        self._connections_lock = threading.Lock()
+        
+        # Cola de mensajes pendientes de add_message_async
+        self._message_queue = deque()
+        self._message_event = threading.Event()
+        self._flush_thread: Optional[threading.Thread] = None
+        self._flush_thread_lock = threading.Lock()
+        
+        # Caché en memoria de la tabla settings (lecturas sin tocar el archivo)
+        self._settings_lock = threading.Lock()
+        self._init_settings_cache()
+        
         logger.info(f"SharedDataManager inicializado: {self.shared_db_path}")
     
     def _init_shared_database(self):
-        """Inicializa la base de datos compartida con todas las tablas necesarias."""
+        """
+        Inicializa la base de datos compartida con todas las tablas necesarias.
+        
+        Si PRAGMA user_version indica que el esquema ya está al día, no se
+        ejecuta ninguna sentencia DDL.
+        """
         try:
             with sqlite3.connect(self.shared_db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Tabla de medicamentos/recordatorios
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS reminders (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL,
-                        quantity TEXT DEFAULT '',
-                        prescription TEXT DEFAULT '',
-                        times TEXT NOT NULL,  -- JSON array de horarios
-                        days TEXT NOT NULL,   -- JSON array de días
-                        photo_path TEXT DEFAULT '',
-                        is_active BOOLEAN DEFAULT TRUE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Tabla de tareas
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS tasks (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL,
-                        times TEXT NOT NULL,  -- JSON array de horarios
-                        days TEXT NOT NULL,   -- JSON array de días
-                        is_active BOOLEAN DEFAULT TRUE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Tabla de contactos
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS contacts (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        display_name TEXT NOT NULL,
-                        aliases TEXT NOT NULL,    -- JSON array de aliases
-                        platform TEXT NOT NULL,
-                        details TEXT NOT NULL,    -- Chat ID, teléfono, etc.
-                        telegram_chat_id TEXT,    -- Campo específico para chat_id de Telegram
-                        is_emergency BOOLEAN DEFAULT FALSE,
-                        is_active BOOLEAN DEFAULT TRUE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Tabla de configuraciones globales
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS settings (
-                        key TEXT PRIMARY KEY,
-                        value TEXT NOT NULL,
-                        category TEXT DEFAULT 'general',
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version >= SCHEMA_VERSION:
+                    logger.debug(f"Esquema de BD compartida al día (versión {version})")
+                    return
                 
-                # Tabla de mensajes recibidos
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS received_messages (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        contact_id INTEGER NOT NULL,
-                        message_text TEXT NOT NULL,
-                        telegram_message_id INTEGER UNIQUE,
-                        sender_chat_id TEXT NOT NULL,
-                        received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        is_read BOOLEAN DEFAULT FALSE,
-                        is_notified BOOLEAN DEFAULT FALSE,
-                        FOREIGN KEY (contact_id) REFERENCES contacts (id)
-                    )
-                """)
-                
-                # Insertar configuraciones por defecto
-                cursor.execute("""
-                    INSERT OR IGNORE INTO settings (key, value, category) 
-                    VALUES ('voice_name', 'es-US-Neural2-A', 'tts')
-                """)
-                cursor.execute("""
-                    INSERT OR IGNORE INTO settings (key, value, category) 
-                    VALUES ('app_theme', 'dark', 'ui')
-                """)
-                
-                conn.commit()
+                self._enable_wal(conn)
+                self._configure_connection(conn)
+                conn.executescript(SCHEMA_SQL)
                 
             logger.info("Base de datos compartida inicializada correctamente")
             
-        except Exception as e:
+        except sqlite3.Error as e:
             logger.error(f"Error inicializando base de datos compartida: {e}")
             raise
     
+    def _enable_wal(self, conn: sqlite3.Connection):
+        """Activa el modo WAL (persistente) en la BD compartida."""
+        mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        if mode.lower() != 'wal':
+            logger.warning(f"No se pudo activar WAL en BD compartida (modo actual: {mode})")
+    
+    def _configure_connection(self, conn: sqlite3.Connection):
+        """Aplica los PRAGMAs de rendimiento a una conexión nueva."""
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+    
+    def _init_settings_cache(self):
+        """
+        Crea la caché de diccionario de la tabla settings.
+        
+        Usa una conexión propia de larga duración: PRAGMA data_version es por
+        conexión y solo cambia cuando otra conexión modifica la BD.
+        """
+        self._settings_conn: Optional[sqlite3.Connection] = None
+        self._settings_cache: Dict[str, tuple] = {}  # key -> (value, category)
+        self._settings_data_version = None
+        with self._settings_lock:
+            self._refresh_settings_cache()
+    
+    def _refresh_settings_cache(self):
+        """
+        Recarga la caché de configuraciones si otro proceso modificó la BD
+        compartida, según PRAGMA data_version. Reabre la conexión de
+        configuraciones si close_all la cerró.
+        
+        Debe llamarse con self._settings_lock adquirido.
+        """
+        conn = self._settings_conn
+        if conn is None:
+            conn = sqlite3.connect(self.shared_db_path, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+            self._configure_connection(conn)
+            self._settings_conn = conn
+            self._settings_data_version = None
+        
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._settings_data_version:
+            return
+        
+        self._settings_cache = {
+            key: (value, category)
+            for key, value, category in conn.execute(SQL_LOAD_SETTINGS)
+        }
+        self._settings_data_version = version
+    
     def get_connection(self) -> sqlite3.Connection:
         """
-        Obtiene una conexión a la base de datos compartida.
+        Obtiene la conexión a la base de datos compartida del hilo actual.
+        
+        La conexión se crea una sola vez por hilo y se reutiliza en las
+        llamadas siguientes, conservando la caché de páginas y de sentencias.
+        Usarla como context manager solo confirma/revierte la transacción;
+        no la cierra.
         
         Returns:
             Conexión a la BD compartida
+            
+        Raises:
+            SharedDBUnavailable: Si la BD compartida no se puede abrir
         """
-        conn = sqlite3.connect(self.shared_db_path)
-        conn.row_factory = sqlite3.Row
+        holder = getattr(self._tls, 'conn', None)
+        if holder is not None:
+            return holder.conn
+        
+        try:
+            conn = sqlite3.connect(self.shared_db_path, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+            conn.row_factory = sqlite3.Row
+            self._configure_connection(conn)
+        except sqlite3.Error as e:
+            raise SharedDBUnavailable(f"No se pudo abrir {self.shared_db_path}: {e}") from e
+        
+        holder = _ThreadConnection(conn)
+        self._tls.conn = holder
+        with self._connections_lock:
+            self._connections.add(holder)
         return conn
     
+    def close_all(self):
+        """Cierra todas las conexiones reutilizables (para el apagado del proceso)."""
+        self.flush_messages()
+        
+        with self._connections_lock:
+            holders = list(self._connections)
+            self._connections = weakref.WeakSet()
+            self._tls = threading.local()
+        
+        with self._settings_lock:
+            settings_conn, self._settings_conn = self._settings_conn, None
+        
+        for holder in holders:
+            try:
+                holder.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Error cerrando conexión compartida: {e}")
+        if settings_conn is not None:
+            try:
+                settings_conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Error cerrando conexión compartida: {e}")
+    
+    def _write(self, sql: str, params: tuple, done_message: Optional[str],
+               error_message: str) -> bool:
+        """
+        Ejecuta una escritura de una sola sentencia en su propia transacción.
+        
+        Args:
+            sql: Sentencia (una de las constantes SQL_*)
+            params: Parámetros de la sentencia
+            done_message: Mensaje de log si se completó (None para no registrar)
+            error_message: Prefijo del mensaje de error
+            
+        Returns:
+            True si se completó correctamente
+        """
+        try:
+            conn = self.get_connection()
+            with conn:
+                conn.execute(sql, params)
+                
+            if done_message:
+                logger.info(done_message)
+            return True
+            
+        except sqlite3.Error as e:
+            logger.error(f"{error_message}: {e}")
+            return False
+    
     # === MÉTODOS DE MEDICAMENTOS ===
     
+    def iter_medications(self) -> Iterator[Dict[str, Any]]:
+        """Recorre los medicamentos activos fila a fila, sin materializar la lista."""
+        for row in self.get_connection().execute(SQL_LIST_MEDICATIONS):
+            try:
+                times = format_times(row['times'])
+                days = format_days(row['days'])
+            except _ROW_DECODE_ERRORS as e:
+                logger.error(f"Medicamento {row['id']} con horario ilegible, se omite: {e}")
+                continue
+            
+            # Convertir formato para compatibilidad con API existente
+            yield {
+                'id': row['id'],
+                'medication_name': row['name'],  # Nombre esperado por API
+                'cantidad': row['quantity'] or '',
+                'prescripcion': row['prescription'] or '',
+                'times': times,          # String para compatibilidad
+                'days_of_week': days,    # String para compatibilidad
+                'photo_path': row['photo_path'] or '',
+                'created_at': row['created_at']
+            }
+    
     def list_medications(self) -> List[Dict[str, Any]]:
         """Lista todos los medicamentos activos."""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT id, name, quantity, prescription, times, days, photo_path, created_at
-                    FROM reminders 
-                    WHERE is_active = TRUE
-                    ORDER BY created_at DESC
-                """)
+            return list(self.iter_medications())
                 
-                medications = []
-                for row in cursor.fetchall():
-                    # Convertir formato para compatibilidad con API existente
-                    times_list = json.loads(row['times']) if row['times'] else []
-                    days_list = json.loads(row['days']) if row['days'] else []
-                    
-                    medications.append({
-                        'id': row['id'],
-                        'medication_name': row['name'],  # Nombre esperado por API
-                        'cantidad': row['quantity'] or '',
-                        'prescripcion': row['prescription'] or '',
-                        'times': ','.join(times_list),   # String para compatibilidad
-                        'days_of_week': ','.join(days_list),  # String para compatibilidad
-                        'photo_path': row['photo_path'] or '',
-                        'created_at': row['created_at']
-                    })
-                
-                return medications
-                
-        except Exception as e:
+        except sqlite3.Error as e:
             logger.error(f"Error listando medicamentos: {e}")
             return []
     
@@ -216,250 +681,209 @@ class SharedDataManager:
         Returns:
             True si se agregó correctamente
         """
-        try:
-            if times is None:
-                times = []
-            if days is None:
-                days = []
-                
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO reminders (name, quantity, prescription, times, days, photo_path)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    name, quantity, prescription,
-                    json.dumps(times), json.dumps(days), photo_path
-                ))
-                conn.commit()
-                
-            logger.info(f"Medicamento agregado: {name}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error agregando medicamento: {e}")
-            return False
+        return self._write(
+            SQL_INSERT_REMINDER,
+            _medication_params(name, quantity, prescription, times, days, photo_path),
+            f"Medicamento agregado: {name}",
+            "Error agregando medicamento"
+        )
     
     def delete_medication(self, medication_id: int) -> bool:
         """Elimina un medicamento (soft delete)."""
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    UPDATE reminders 
-                    SET is_active = FALSE, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                """, (medication_id,))
-                conn.commit()
-                
-            logger.info(f"Medicamento eliminado: {medication_id}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error eliminando medicamento: {e}")
-            return False
+        return self._write(
+            SQL_SOFT_DELETE_REMINDER, (medication_id,),
+            f"Medicamento eliminado: {medication_id}",
+            "Error eliminando medicamento"
+        )
     
     # === MÉTODOS DE TAREAS ===
     
+    def iter_tasks(self) -> Iterator[Dict[str, Any]]:
+        """Recorre las tareas activas fila a fila, sin materializar la lista."""
+        for row in self.get_connection().execute(SQL_LIST_TASKS):
+            try:
+                times = format_times(row['times'])
+                days = format_days(row['days'])
+            except _ROW_DECODE_ERRORS as e:
+                logger.error(f"Tarea {row['id']} con horario ilegible, se omite: {e}")
+                continue
+            
+            yield {
+                'id': row['id'],
+                'task_name': row['name'],  # Nombre esperado por API
+                'name': row['name'],       # Formato alternativo
+                'times': times,
+                'days_of_week': days,
+                'created_at': row['created_at']
+            }
+    
     def list_tasks(self) -> List[Dict[str, Any]]:
         """Lista todas las tareas activas."""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT id, name, times, days, created_at
-                    FROM tasks 
-                    WHERE is_active = TRUE
-                    ORDER BY created_at DESC
-                """)
-                
-                tasks = []
-                for row in cursor.fetchall():
-                    times_list = json.loads(row['times']) if row['times'] else []
-                    days_list = json.loads(row['days']) if row['days'] else []
-                    
-                    tasks.append({
-                        'id': row['id'],
-                        'task_name': row['name'],  # Nombre esperado por API
-                        'name': row['name'],       # Formato alternativo
-                        'times': ','.join(times_list),
-                        'days_of_week': ','.join(days_list),
-                        'created_at': row['created_at']
-                    })
+            return list(self.iter_tasks())
                 
-                return tasks
-                
-        except Exception as e:
+        except sqlite3.Error as e:
             logger.error(f"Error listando tareas: {e}")
             return []
     
     def add_task(self, name: str, times: List[str] = None, days: List[str] = None) -> bool:
         """Agrega una tarea."""
-        try:
-            if times is None:
-                times = []
-            if days is None:
-                days = []
-                
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO tasks (name, times, days)
-                    VALUES (?, ?, ?)
-                """, (name, json.dumps(times), json.dumps(days)))
-                conn.commit()
-                
-            logger.info(f"Tarea agregada: {name}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error agregando tarea: {e}")
-            return False
+        return self._write(
+            SQL_INSERT_TASK, _task_params(name, times, days),
+            f"Tarea agregada: {name}",
+            "Error agregando tarea"
+        )
     
     def delete_task(self, task_id: int) -> bool:
         """Elimina una tarea (soft delete)."""
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    UPDATE tasks 
-                    SET is_active = FALSE, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                """, (task_id,))
-                conn.commit()
-                
-            logger.info(f"Tarea eliminada: {task_id}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error eliminando tarea: {e}")
-            return False
+        return self._write(
+            SQL_SOFT_DELETE_TASK, (task_id,),
+            f"Tarea eliminada: {task_id}",
+            "Error eliminando tarea"
+        )
     
     # === MÉTODOS DE CONTACTOS ===
     
+    def iter_contacts(self) -> Iterator[Dict[str, Any]]:
+        """Recorre los contactos activos fila a fila, sin materializar la lista."""
+        cursor = self.get_connection().cursor()
+        cursor.row_factory = None
+        for row in cursor.execute(SQL_LIST_CONTACTS):
+            aliases = row[2] or ''  # String para compatibilidad
+            try:
+                values = (row[0], row[1], row[1], aliases, row[3], row[4], row[4],
+                          int(row[5]), bool(row[5]), row[6])
+            except _ROW_DECODE_ERRORS as e:
+                logger.error(f"Contacto {row[0]} con datos ilegibles, se omite: {e}")
+                continue
+            yield dict(zip(_CONTACT_KEYS, values))
+    
     def list_contacts(self) -> List[Dict[str, Any]]:
         """Lista todos los contactos activos."""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT id, display_name, aliases, platform, details, is_emergency, created_at
-                    FROM contacts 
-                    WHERE is_active = TRUE
-                    ORDER BY display_name
-                """)
-                
-                contacts = []
-                for row in cursor.fetchall():
-                    aliases_list = json.loads(row['aliases']) if row['aliases'] else []
-                    
-                    contacts.append({
-                        'id': row['id'],
-                        'display_name': row['display_name'],
-                        'displayName': row['display_name'],   # Formato nuevo
-                        'aliases': ','.join(aliases_list),    # String para compatibilidad
-                        'platform': row['platform'],
-                        'details': row['details'],
-                        'contact_details': row['details'],    # Alias para compatibilidad
-                        'is_emergency': int(row['is_emergency']),  # Int para legacy
-                        'isEmergency': bool(row['is_emergency']),  # Boolean para nuevo
-                        'created_at': row['created_at']
-                    })
+            return list(self.iter_contacts())
                 
-                return contacts
-                
-        except Exception as e:
+        except sqlite3.Error as e:
             logger.error(f"Error listando contactos: {e}")
             return []
     
     def add_contact(self, display_name: str, aliases: List[str], platform: str,
                    details: str, telegram_chat_id: str = None, is_emergency: bool = False) -> bool:
         """Agrega un contacto."""
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO contacts (display_name, aliases, platform, details, telegram_chat_id, is_emergency)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (display_name, json.dumps(aliases), platform, details, telegram_chat_id, is_emergency))
-                conn.commit()
-                
-            logger.info(f"Contacto agregado: {display_name}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error agregando contacto: {e}")
-            return False
+        return self._write(
+            SQL_INSERT_CONTACT,
+            _contact_params(display_name, aliases, platform, details, telegram_chat_id, is_emergency),
+            f"Contacto agregado: {display_name}",
+            "Error agregando contacto"
+        )
     
     def delete_contact(self, contact_id: int) -> bool:
         """Elimina un contacto (soft delete)."""
+        return self._write(
+            SQL_SOFT_DELETE_CONTACT, (contact_id,),
+            f"Contacto eliminado: {contact_id}",
+            "Error eliminando contacto"
+        )
+    
+    # === VISTA CONJUNTA ===
+    
+    def list_dashboard(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Lista medicamentos, tareas y contactos activos en una sola
+        transacción de lectura (misma instantánea para las tres listas).
+        
+        Returns:
+            Dict con las claves 'medications', 'tasks' y 'contacts'
+        """
+        conn = self.get_connection()
+        own_transaction = not conn.in_transaction
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    UPDATE contacts 
-                    SET is_active = FALSE, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                """, (contact_id,))
-                conn.commit()
+            if own_transaction:
+                conn.execute("BEGIN")
+            try:
+                return {
+                    'medications': list(self.iter_medications()),
+                    'tasks': list(self.iter_tasks()),
+                    'contacts': list(self.iter_contacts()),
+                }
+            finally:
+                if own_transaction:
+                    conn.execute("COMMIT")
                 
-            logger.info(f"Contacto eliminado: {contact_id}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error eliminando contacto: {e}")
-            return False
+        except sqlite3.Error as e:
+            logger.error(f"Error listando datos compartidos: {e}")
+            return {'medications': [], 'tasks': [], 'contacts': []}
+    
+    # === OPERACIONES EN LOTE ===
+    
+    @contextmanager
+    def batch(self):
+        """
+        Agrupa varias escrituras en una sola transacción (un único commit).
+        
+        Ejemplo:
+            with shared_data_manager.batch() as b:
+                b.add_medication("Paracetamol", times=["08:00"], days=["0"])
+                b.add_task("Caminar", ["18:00"], ["1", "3"])
+        
+        Si ocurre un error dentro del bloque se revierte toda la transacción.
+        """
+        conn = self.get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield SharedDataBatch(conn)
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
     
     # === MÉTODOS DE CONFIGURACIÓN ===
     
     def get_setting(self, key: str, default_value: Any = None) -> Any:
         """Obtiene una configuración global."""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
-                row = cursor.fetchone()
+            with self._settings_lock:
+                self._refresh_settings_cache()
+                entry = self._settings_cache.get(key)
                 
-                if row:
-                    return row['value']
-                else:
-                    return default_value
+            if entry:
+                return entry[0]
+            else:
+                return default_value
                     
-        except Exception as e:
+        except sqlite3.Error as e:
             logger.error(f"Error obteniendo configuración {key}: {e}")
             return default_value
     
     def set_setting(self, key: str, value: Any, category: str = 'general') -> bool:
-        """Establece una configuración global."""
+        """Establece una configuración global (escribe en BD y en la caché)."""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT OR REPLACE INTO settings (key, value, category, updated_at)
-                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-                """, (key, str(value), category))
-                conn.commit()
+            with self._settings_lock:
+                self._refresh_settings_cache()
+                params = (key, str(value), category)
+                with self._settings_conn as conn:
+                    conn.execute(SQL_UPSERT_SETTING, params)
+                self._settings_cache[key] = (str(value), category)
                 
             logger.info(f"Configuración actualizada: {key} = {value}")
             return True
             
-        except Exception as e:
+        except sqlite3.Error as e:
             logger.error(f"Error estableciendo configuración {key}: {e}")
             return False
     
     def get_all_settings(self, category: str = None) -> Dict[str, str]:
         """Obtiene todas las configuraciones, opcionalmente filtradas por categoría."""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                if category:
-                    cursor.execute("SELECT key, value FROM settings WHERE category = ?", (category,))
-                else:
-                    cursor.execute("SELECT key, value FROM settings")
+            with self._settings_lock:
+                self._refresh_settings_cache()
+                return {
+                    key: value for key, (value, key_category) in self._settings_cache.items()
+                    if not category or key_category == category
+                }
                 
-                return {row['key']: row['value'] for row in cursor.fetchall()}
-                
-        except Exception as e:
+        except sqlite3.Error as e:
             logger.error(f"Error obteniendo configuraciones: {e}")
             return {}
     
@@ -482,43 +906,117 @@ class SharedDataManager:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                
-                # Buscar o crear contacto
-                cursor.execute("SELECT id FROM contacts WHERE display_name = ?", (contact_name,))
-                contact = cursor.fetchone()
-                
-                if not contact:
-                    # Crear contacto nuevo
-                    cursor.execute("""
-                        INSERT INTO contacts (display_name, aliases, platform, details, telegram_chat_id, is_emergency, is_active) 
-                        VALUES (?, ?, ?, ?, ?, FALSE, TRUE)
-                    """, (contact_name, '[]', 'telegram', sender_chat_id, sender_chat_id))
-                    contact_id = cursor.lastrowid
-                else:
-                    contact_id = contact['id']
-                    # Actualizar telegram_chat_id si no existe
-                    cursor.execute("""
-                        UPDATE contacts SET telegram_chat_id = ?, updated_at = CURRENT_TIMESTAMP 
-                        WHERE id = ? AND telegram_chat_id IS NULL
-                    """, (sender_chat_id, contact_id))
-                
-                # Insertar mensaje
-                cursor.execute("""
-                    INSERT INTO received_messages 
-                    (contact_id, message_text, telegram_message_id, sender_chat_id, received_at, is_read, is_notified)
-                    VALUES (?, ?, ?, ?, ?, FALSE, FALSE)
-                """, (contact_id, message_text, telegram_message_id, sender_chat_id, datetime.now()))
-                
-                message_id = cursor.lastrowid
+                message_id = self._insert_message(
+                    cursor, contact_name, message_text, telegram_message_id, sender_chat_id
+                )
                 conn.commit()
                 
-                logger.info(f"Mensaje agregado: ID {message_id} de {contact_name}")
+                if message_id == -1:
+                    logger.info(f"Mensaje duplicado ignorado: Telegram ID {telegram_message_id} de {contact_name}")
+                else:
+                    logger.info(f"Mensaje agregado: ID {message_id} de {contact_name}")
                 return message_id
                 
-        except Exception as e:
+        except sqlite3.Error as e:
             logger.error(f"Error agregando mensaje: {e}")
             return -1
     
+    def _insert_message(self, cursor: sqlite3.Cursor, contact_name: str, message_text: str,
+                        telegram_message_id: int, sender_chat_id: str) -> int:
+        """Busca o crea el contacto e inserta el mensaje (sin confirmar)."""
+        # Buscar contacto (actualizando telegram_chat_id si no existe) o crearlo
+        cursor.execute(SQL_TOUCH_MESSAGE_CONTACT, (sender_chat_id, contact_name))
+        contact = cursor.fetchone()
+        
+        if contact:
+            contact_id = contact[0]
+        else:
+            # Crear contacto nuevo
+            cursor.execute(SQL_INSERT_MESSAGE_CONTACT, (contact_name, '[]', 'telegram', sender_chat_id, sender_chat_id))
+            contact_id = cursor.lastrowid
+        
+        # Insertar mensaje (-1 si ya existía)
+        cursor.execute(SQL_INSERT_MESSAGE, (contact_id, message_text, telegram_message_id, sender_chat_id))
+        message = cursor.fetchone()
+        return message[0] if message else -1
+    
+    def add_message_async(self, contact_name: str, message_text: str, telegram_message_id: int,
+                          sender_chat_id: str) -> Future:
+        """
+        Encola un mensaje para guardarlo junto con los que lleguen en la misma ráfaga.
+        
+        Un hilo de fondo espera MESSAGE_FLUSH_INTERVAL tras el primer mensaje y
+        guarda todos los encolados en una única transacción.
+        
+        Args: los mismos que add_message
+            
+        Returns:
+            Future: Se resuelve con el ID del mensaje (-1 si era duplicado o hubo error)
+        """
+        future = Future()
+        self._message_queue.append(
+            ((contact_name, message_text, telegram_message_id, sender_chat_id), future)
+        )
+        self._ensure_flush_thread()
+        self._message_event.set()
+        return future
+    
+    def flush_messages(self) -> int:
+        """
+        Guarda inmediatamente los mensajes encolados por add_message_async.
+        
+        Returns:
+            int: Número de mensajes procesados
+        """
+        pending = []
+        while True:
+            try:
+                pending.append(self._message_queue.popleft())
+            except IndexError:
+                break
+        if not pending:
+            return 0
+        
+        try:
+            conn = self.get_connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                cursor = conn.cursor()
+                message_ids = [self._insert_message(cursor, *args) for args, _ in pending]
+            logger.info(f"Mensajes guardados en lote: {len(pending)}")
+            
+        except Exception as e:
+            # Cualquier fallo (no solo sqlite3.Error) debe resolver los futures
+            # ya extraídos de la cola; si no, quien espera se queda colgado
+            logger.error(f"Error guardando mensajes encolados: {e}")
+            message_ids = [-1] * len(pending)
+        
+        for (_, future), message_id in zip(pending, message_ids):
+            future.set_result(message_id)
+        return len(pending)
+    
+    def _ensure_flush_thread(self):
+        """Arranca (una sola vez) el hilo que vacía la cola de mensajes."""
+        if self._flush_thread is not None:
+            return
+        with self._flush_thread_lock:
+            if self._flush_thread is None:
+                thread = threading.Thread(target=self._flush_loop, name="SharedDataMessageFlush", daemon=True)
+                thread.start()
+                self._flush_thread = thread
+    
+    def _flush_loop(self):
+        """Bucle del hilo de fondo: espera una ráfaga y la guarda de una vez."""
+        while True:
+            self._message_event.wait()
+            time.sleep(MESSAGE_FLUSH_INTERVAL)
+            self._message_event.clear()
+            try:
+                self.flush_messages()
+            except Exception as e:
+                # El hilo es único: si muere, la cola deja de vaciarse para siempre
+                logger.error(f"Error en el hilo de guardado de mensajes: {e}")
+    
     def get_unread_messages(self, limit: int = 3) -> List[Dict[str, Any]]:
         """
         Obtiene los mensajes más antiguos no leídos.
@@ -530,33 +1028,17 @@ class SharedDataManager:
             List[Dict]: Lista de mensajes no leídos
         """
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT 
-                        m.id,
-                        m.message_text,
-                        m.received_at,
-                        c.display_name as contact_name
-                    FROM received_messages m
-                    JOIN contacts c ON m.contact_id = c.id
-                    WHERE m.is_read = FALSE
-                    ORDER BY m.received_at ASC
-                    LIMIT ?
-                """, (limit,))
-                
-                messages = []
-                for row in cursor.fetchall():
-                    messages.append({
-                        'id': row['id'],
-                        'contact_name': row['contact_name'],
-                        'message_text': row['message_text'],
-                        'received_at': row['received_at']
-                    })
-                
-                return messages
+            # Tuplas simples: (id, message_text, received_at, contact_name)
+            cursor = self.get_connection().cursor()
+            cursor.row_factory = None
+            cursor.execute(SQL_UNREAD_MESSAGES, (limit,))
+            
+            return [
+                {'id': r[0], 'contact_name': r[3], 'message_text': r[1], 'received_at': r[2]}
+                for r in cursor
+            ]
                 
-        except Exception as e:
+        except sqlite3.Error as e:
             logger.error(f"Error obteniendo mensajes no leídos: {e}")
             return []
     
@@ -574,25 +1056,15 @@ class SharedDataManager:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Marcar como leídos
-                placeholders = ','.join('?' * len(message_ids))
-                cursor.execute(f"""
-                    UPDATE received_messages 
-                    SET is_read = TRUE 
-                    WHERE id IN ({placeholders})
-                """, message_ids)
-                
-                # Eliminar mensajes leídos (como en funcionalidad original)
-                cursor.execute(f"""
-                    DELETE FROM received_messages 
-                    WHERE id IN ({placeholders})
-                """, message_ids)
+                # Los mensajes leídos se eliminan directamente (como en funcionalidad
+                # original); marcarlos antes como leídos sería trabajo descartado
+                cursor.execute(SQL_DELETE_MESSAGES, (json.dumps(message_ids),))
                 
                 conn.commit()
                 logger.info(f"Mensajes marcados como leídos y eliminados: {message_ids}")
                 return True
                 
-        except Exception as e:
+        except sqlite3.Error as e:
             logger.error(f"Error marcando mensajes como leídos: {e}")
             return False
     
@@ -604,13 +1076,12 @@ class SharedDataManager:
             int: Cantidad de mensajes no leídos
         """
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT COUNT(*) as count FROM received_messages WHERE is_read = FALSE")
-                result = cursor.fetchone()
-                return result['count'] if result else 0
+            # Cursor sin row_factory: acceso posicional al único valor
+            cursor = self.get_connection().cursor()
+            cursor.row_factory = None
+            return cursor.execute(SQL_UNREAD_COUNT).fetchone()[0]
                 
-        except Exception as e:
+        except sqlite3.Error as e:
             logger.error(f"Error contando mensajes no leídos: {e}")
             return 0
     
@@ -624,20 +1095,28 @@ class SharedDataManager:
         Returns:
             bool: True si se marcó exitosamente
         """
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    UPDATE received_messages 
-                    SET is_notified = TRUE 
-                    WHERE id = ?
-                """, (message_id,))
-                conn.commit()
-                return True
-                
-        except Exception as e:
-            logger.error(f"Error marcando mensaje como notificado: {e}")
-            return False
+        return self._write(
+            SQL_MARK_NOTIFIED, (message_id,),
+            None,
+            "Error marcando mensaje como notificado"
+        )
+
+# Instancia global del gestor de datos compartidos (se crea en el primer uso,
+# no al importar el módulo)
+_instance: Optional[SharedDataManager] = None
+_instance_lock = threading.Lock()
+
+def get_shared_data_manager() -> SharedDataManager:
+    """Obtiene la instancia global del gestor, creándola la primera vez."""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = SharedDataManager()
+    return _instance
 
-# Instancia global del gestor de datos compartidos
-shared_data_manager = SharedDataManager()
\ No newline at end of file
+def __getattr__(name: str):
+    # Compatibilidad: `from ...shared_data_manager import shared_data_manager`
+    if name == 'shared_data_manager':
+        return get_shared_data_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
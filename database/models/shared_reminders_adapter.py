@@ -15,13 +15,47 @@ Versión: 2.0.0
 """
 
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 
-from .shared_data_manager import shared_data_manager
+from .shared_data_manager import get_shared_data_manager, SharedDBUnavailable
 from .user_context import get_current_user, get_user_preferences, set_user_preferences
 
 logger = logging.getLogger(__name__)
 
+# Segundos que se espera antes de reintentar la BD compartida tras
+# detectar que no está disponible
+SHARED_RETRY_INTERVAL = 30.0
+
+# Respuestas por defecto cuando el módulo legacy no implementa una operación
+_empty_list = lambda *args, **kwargs: []
+_false = lambda *args, **kwargs: False
+_true = lambda *args, **kwargs: True
+_default_value = lambda key, default_value=None: default_value
+_empty_dashboard = lambda *args, **kwargs: {'medications': [], 'tasks': [], 'contacts': []}
+
+@lru_cache(maxsize=256)
+def _split_csv(value: str) -> Tuple[str, ...]:
+    """Divide una lista separada por comas (formato API) descartando vacíos."""
+    return tuple(item for item in (part.strip() for part in value.split(',')) if item)
+
+_LEGACY_FALLBACKS = {
+    'list_medications': _empty_list,
+    'add_medication': _false,
+    'delete_medication': _false,
+    'list_tasks': _empty_list,
+    'add_task': _false,
+    'delete_task': _false,
+    'list_contacts': _empty_list,
+    'add_contact': _false,
+    'delete_contact': _false,
+    'get_setting': _default_value,
+    'set_setting': _true,
+    'list_dashboard': _empty_dashboard,
+}
+
 class SharedRemindersAdapter:
     """
     Adaptador que redirige operaciones a base de datos compartida,
@@ -39,46 +73,103 @@ class SharedRemindersAdapter:
             fallback_to_legacy: Si usar sistema legacy como fallback
         """
         self.fallback_to_legacy = fallback_to_legacy
-        self.legacy_available = True
         
-        # Intentar importar el sistema legacy para fallback
-        try:
-            import reminders as legacy_reminders
-            self.legacy_reminders = legacy_reminders
-            logger.info("Sistema legacy disponible como fallback")
-        except ImportError:
-            self.legacy_available = False
-            logger.warning("Sistema legacy no disponible")
-    
-    def _use_shared_system(self) -> bool:
-        """Determina si el sistema compartido está disponible."""
+        # El módulo legacy se importa la primera vez que se necesita
+        self._legacy_reminders = None
+        self._legacy_import_failed = False
+        self._legacy = {}
+        
+        # Operaciones del sistema compartido, resueltas una sola vez en el
+        # primer uso (así importar el módulo no crea la BD compartida)
+        self._shared = {}
+        
+        # Estado de la BD compartida; tras un SharedDBUnavailable se usa
+        # legacy directamente hasta _shared_retry_at
+        self._shared_ok = True
+        self._shared_retry_at = 0.0
+        
+        # Marca, por hilo, que se está ejecutando una operación legacy
+        self._fallback_state = threading.local()
+    
+    @property
+    def legacy_reminders(self):
+        """Módulo legacy de recordatorios, importado bajo demanda (None si no existe)."""
+        if self._legacy_reminders is None and not self._legacy_import_failed:
+            try:
+                import reminders as legacy_reminders
+                self._legacy_reminders = legacy_reminders
+                facade = getattr(legacy_reminders, 'reminders_adapter', None)
+                if getattr(facade, 'shared_adapter', None) is self:
+                    # reminders solo delega en este mismo adaptador: usarlo como
+                    # fallback volvería a entrar aquí, así que durante una
+                    # caída se devuelven las respuestas por defecto
+                    self._legacy = dict(_LEGACY_FALLBACKS)
+                    logger.info("Sistema legacy delega en el adaptador compartido; "
+                                "fallback con respuestas por defecto")
+                else:
+                    # Resolver una sola vez las operaciones legacy disponibles
+                    self._legacy = {
+                        name: getattr(legacy_reminders, name, fallback)
+                        for name, fallback in _LEGACY_FALLBACKS.items()
+                    }
+                    logger.info("Sistema legacy disponible como fallback")
+            except ImportError:
+                # No reintentar la importación en cada fallback
+                self._legacy_import_failed = True
+                logger.warning("Sistema legacy no disponible")
+        return self._legacy_reminders
+    
+    @property
+    def legacy_available(self) -> bool:
+        """Indica si el sistema legacy puede usarse como fallback."""
+        return self.legacy_reminders is not None
+    
+    def _call_legacy(self, key: str, *args, **kwargs):
+        """Ejecuta la operación legacy marcando el hilo como dentro de un fallback."""
+        state = self._fallback_state
+        state.active = True
         try:
-            # Verificar que el gestor compartido funciona
-            shared_data_manager.get_connection().close()
-            return True
-        except Exception as e:
-            logger.warning(f"Sistema compartido no disponible: {e}")
-            return False
+            return self._legacy[key](*args, **kwargs)
+        finally:
+            state.active = False
     
-    def _execute_with_fallback(self, shared_func, legacy_func, *args, **kwargs):
+    def _execute_with_fallback(self, key: str, *args, **kwargs):
         """
         Ejecuta función en sistema compartido, con fallback a legacy.
+        
+        Args:
+            key: Nombre de la operación (igual en el sistema compartido y en legacy)
         """
-        if self._use_shared_system():
+        # El módulo legacy puede volver a llamar a este adaptador (reminders
+        # delega en reminders_adapter); en ese caso se devuelve la respuesta
+        # por defecto en lugar de entrar en una recursión infinita
+        if getattr(self._fallback_state, 'active', False):
+            return _LEGACY_FALLBACKS[key](*args, **kwargs)
+        
+        if self._shared_ok or time.monotonic() >= self._shared_retry_at:
             try:
-                return shared_func(*args, **kwargs)
+                if not self._shared:
+                    manager = get_shared_data_manager()
+                    self._shared = {
+                        name: getattr(manager, name) for name in _LEGACY_FALLBACKS
+                    }
+                result = self._shared[key](*args, **kwargs)
+                self._shared_ok = True
+                return result
+            except SharedDBUnavailable as e:
+                logger.warning(f"Sistema compartido no disponible: {e}")
+                self._shared_ok = False
+                self._shared_retry_at = time.monotonic() + SHARED_RETRY_INTERVAL
             except Exception as e:
                 logger.error(f"Error en sistema compartido: {e}")
-                if self.fallback_to_legacy and self.legacy_available:
-                    logger.info("Fallback a sistema legacy")
-                    return legacy_func(*args, **kwargs)
-                else:
+                if not (self.fallback_to_legacy and self.legacy_available):
                     raise
-        else:
-            if self.legacy_available:
-                return legacy_func(*args, **kwargs)
-            else:
-                raise RuntimeError("Ni sistema compartido ni legacy disponibles")
+                logger.info("Fallback a sistema legacy")
+                return self._call_legacy(key, *args, **kwargs)
+        
+        if self.legacy_available:
+            return self._call_legacy(key, *args, **kwargs)
+        raise RuntimeError("Ni sistema compartido ni legacy disponibles")
     
     # === MÉTODOS DE MEDICAMENTOS (COMPARTIDOS) ===
     
@@ -89,17 +180,15 @@ class SharedRemindersAdapter:
     def list_medications(self) -> List[Dict[str, Any]]:
         """Lista todos los medicamentos desde BD compartida."""
         return self._execute_with_fallback(
-            shared_data_manager.list_medications,
-            lambda: self.legacy_reminders.list_medications() 
-            if hasattr(self.legacy_reminders, 'list_medications') else []
+            'list_medications'
         )
     
     def add_reminder(self, medication_name: str, photo_path: str, times: str, 
                     days_of_week: str, cantidad: str = "", prescripcion: str = "") -> bool:
         """Agrega medicamento. Método para compatibilidad con API web."""
         # Convertir formato de API a formato interno
-        times_list = [t.strip() for t in times.split(',') if t.strip()]
-        days_list = [d.strip() for d in days_of_week.split(',') if d.strip()]
+        times_list = list(_split_csv(times))
+        days_list = list(_split_csv(days_of_week))
         
         return self.add_medication(medication_name, cantidad, prescripcion, times_list, days_list, photo_path)
     
@@ -107,9 +196,7 @@ class SharedRemindersAdapter:
                       times: List[str] = None, days: List[str] = None, photo_path: str = "") -> bool:
         """Agrega medicamento a BD compartida."""
         return self._execute_with_fallback(
-            shared_data_manager.add_medication,
-            lambda n, q, p, t, d, ph: self.legacy_reminders.add_medication(n, q, p, t, d, ph)
-            if hasattr(self.legacy_reminders, 'add_medication') else False,
+            'add_medication',
             name, quantity, prescription, times, days, photo_path
         )
     
@@ -120,9 +207,7 @@ class SharedRemindersAdapter:
     def delete_medication(self, medication_id: int) -> bool:
         """Elimina medicamento desde BD compartida."""
         return self._execute_with_fallback(
-            shared_data_manager.delete_medication,
-            lambda mid: self.legacy_reminders.delete_medication(mid)
-            if hasattr(self.legacy_reminders, 'delete_medication') else False,
+            'delete_medication',
             medication_id
         )
     
@@ -131,37 +216,31 @@ class SharedRemindersAdapter:
     def list_tasks(self) -> List[Dict[str, Any]]:
         """Lista todas las tareas desde BD compartida."""
         return self._execute_with_fallback(
-            shared_data_manager.list_tasks,
-            lambda: self.legacy_reminders.list_tasks()
-            if hasattr(self.legacy_reminders, 'list_tasks') else []
+            'list_tasks'
         )
     
     def add_task(self, name: str, times: str, days: str) -> bool:
         """Agrega tarea. Acepta formato string para compatibilidad con API."""
         # Convertir de formato API (strings) a formato interno (listas)
         if isinstance(times, str):
-            times_list = [t.strip() for t in times.split(',') if t.strip()]
+            times_list = list(_split_csv(times))
         else:
             times_list = times
             
         if isinstance(days, str):
-            days_list = [d.strip() for d in days.split(',') if d.strip()]
+            days_list = list(_split_csv(days))
         else:
             days_list = days
         
         return self._execute_with_fallback(
-            lambda n, t, d: shared_data_manager.add_task(n, t, d),
-            lambda n, t, d: self.legacy_reminders.add_task(n, t, d)
-            if hasattr(self.legacy_reminders, 'add_task') else False,
+            'add_task',
             name, times_list, days_list
         )
     
     def delete_task(self, task_id: int) -> bool:
         """Elimina tarea desde BD compartida."""
         return self._execute_with_fallback(
-            shared_data_manager.delete_task,
-            lambda tid: self.legacy_reminders.delete_task(tid)
-            if hasattr(self.legacy_reminders, 'delete_task') else False,
+            'delete_task',
             task_id
         )
     
@@ -170,47 +249,43 @@ class SharedRemindersAdapter:
     def list_contacts(self) -> List[Dict[str, Any]]:
         """Lista todos los contactos desde BD compartida."""
         return self._execute_with_fallback(
-            shared_data_manager.list_contacts,
-            lambda: self.legacy_reminders.list_contacts()
-            if hasattr(self.legacy_reminders, 'list_contacts') else []
+            'list_contacts'
         )
     
     def add_contact(self, display_name: str, aliases: List[str], platform: str,
                    details: str, is_emergency: bool = False) -> bool:
         """Agrega contacto a BD compartida."""
         return self._execute_with_fallback(
-            shared_data_manager.add_contact,
-            lambda dn, a, p, d, ie: self.legacy_reminders.add_contact(dn, a, p, d, ie)
-            if hasattr(self.legacy_reminders, 'add_contact') else False,
+            'add_contact',
             display_name, aliases, platform, details, is_emergency
         )
     
     def delete_contact(self, contact_id: int) -> bool:
         """Elimina contacto desde BD compartida."""
         return self._execute_with_fallback(
-            shared_data_manager.delete_contact,
-            lambda cid: self.legacy_reminders.delete_contact(cid)
-            if hasattr(self.legacy_reminders, 'delete_contact') else False,
+            'delete_contact',
             contact_id
         )
     
+    def list_dashboard(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Lista medicamentos, tareas y contactos en una sola lectura de BD compartida."""
+        return self._execute_with_fallback(
+            'list_dashboard'
+        )
+    
     # === MÉTODOS DE CONFIGURACIÓN (COMPARTIDA) ===
     
     def get_setting(self, key: str, default_value: Any = None) -> Any:
         """Obtiene configuración desde BD compartida."""
         return self._execute_with_fallback(
-            shared_data_manager.get_setting,
-            lambda k, d: self.legacy_reminders.get_setting(k, d)
-            if hasattr(self.legacy_reminders, 'get_setting') else d,
+            'get_setting',
             key, default_value
         )
     
     def set_setting(self, key: str, value: Any) -> bool:
         """Establece configuración en BD compartida."""
         return self._execute_with_fallback(
-            lambda k, v: shared_data_manager.set_setting(k, v),
-            lambda k, v: self.legacy_reminders.set_setting(k, v)
-            if hasattr(self.legacy_reminders, 'set_setting') else True,
+            'set_setting',
             key, value
         )
     
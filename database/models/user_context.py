@@ -13,29 +13,193 @@ Fecha: 2024-08-18
 Versión: 1.0.0
 """
 
+import copy
 import sqlite3
+import json
 import logging
-from functools import wraps
-from flask import g, request, jsonify
-from typing import Optional, Dict, Any
+import queue
+import threading
+import time
+from functools import lru_cache, wraps
+from flask import g, request, jsonify, has_app_context, has_request_context
+from pathlib import Path
+from typing import Optional, Dict, Any, Tuple, Iterable
 
 from .user_manager import user_manager
 
 logger = logging.getLogger(__name__)
 
+# orjson es opcional: serializa el JSON de preferencias varias veces más rápido
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+if ORJSON_AVAILABLE:
+    def _dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode('utf-8')
+    _loads = orjson.loads
+else:
+    def _dumps(obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+    _loads = json.loads
+
+# Máximo de conexiones ociosas que se conservan por BD de usuario
+USER_DB_POOL_SIZE = 8
+
+# PRAGMAs aplicados una sola vez al crear cada conexión del pool
+USER_DB_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",
+)
+
+# data se lee como BLOB (bytes) para que el JSON pase a _loads sin
+# decodificarlo antes a str; el resto de columnas de la conexión son str
+SQL_SELECT_PREFERENCES = "SELECT CAST(data AS BLOB) AS data FROM preferences WHERE category = ?"
+@lru_cache(maxsize=8)
+def _sql_select_categories(count: int) -> str:
+    """SELECT de varias categorías con `count` parámetros."""
+    placeholders = ", ".join("?" * count)
+    return ("SELECT category, CAST(data AS BLOB) AS data FROM preferences "
+            f"WHERE category IN ({placeholders})")
+
+SQL_UPSERT_PREFERENCES = """
+    INSERT OR REPLACE INTO preferences (category, data, updated_at)
+    VALUES (?, ?, CURRENT_TIMESTAMP)
+"""
+
+# Fusión RFC 7396 dentro de SQLite; ?2 se usa también para crear la categoría
+SQL_PATCH_PREFERENCES = """
+    INSERT INTO preferences (category, data, updated_at)
+    VALUES (?1, json_patch('{}', ?2), CURRENT_TIMESTAMP)
+    ON CONFLICT (category) DO UPDATE
+    SET data = json_patch(preferences.data, ?2), updated_at = CURRENT_TIMESTAMP
+"""
+
+# Pool de conexiones por ruta de BD de usuario
+_pool: Dict[str, "queue.Queue[sqlite3.Connection]"] = {}
+_pool_lock = threading.Lock()
+
+# Si el SQLite enlazado incluye JSON1 (None hasta abrir la primera conexión)
+_json1_available: Optional[bool] = None
+
+def _acquire_connection(db_path: str) -> sqlite3.Connection:
+    """
+    Obtiene una conexión del pool de la BD indicada, creándola si no hay
+    ninguna libre.
+    
+    Args:
+        db_path: Ruta a la BD del usuario
+        
+    Returns:
+        sqlite3.Connection: Conexión en modo autocommit, con filas sqlite3.Row
+    """
+    with _pool_lock:
+        pool = _pool.setdefault(db_path, queue.Queue(maxsize=USER_DB_POOL_SIZE))
+    
+    try:
+        return pool.get_nowait()
+    except queue.Empty:
+        pass
+    
+    conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+    for pragma in USER_DB_PRAGMAS:
+        conn.execute(pragma)
+    # Filas accesibles por nombre
+    conn.row_factory = sqlite3.Row
+    
+    global _json1_available
+    if _json1_available is None:
+        try:
+            conn.execute("SELECT json('{}')")
+            _json1_available = True
+        except sqlite3.OperationalError:
+            _json1_available = False
+    return conn
+
+def _release_connection(db_path: str, conn: sqlite3.Connection):
+    """
+    Devuelve una conexión al pool, o la cierra si el pool está lleno.
+    
+    Args:
+        db_path: Ruta a la BD del usuario
+        conn: Conexión obtenida con _acquire_connection
+    """
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        _pool[db_path].put_nowait(conn)
+    except (KeyError, queue.Full, sqlite3.Error):
+        conn.close()
+
+def _discard_pool(db_path: str):
+    """
+    Cierra las conexiones ociosas a la BD de un usuario eliminado. Sin esto,
+    al recrear el usuario el pool devolvería conexiones al archivo borrado.
+    
+    Args:
+        db_path: Ruta a la BD del usuario
+    """
+    with _pool_lock:
+        pool = _pool.pop(db_path, None)
+    if pool is None:
+        return
+    while True:
+        try:
+            pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+user_manager.on_user_deleted(_discard_pool)
+
+# Cache de user_exists: usuario -> (existe, instante de expiración)
+USER_EXISTS_TTL = 60.0
+USER_EXISTS_CACHE_SIZE = 64
+_user_exists_cache: Dict[str, Tuple[bool, float]] = {}
+
+def _user_exists_cached(username: str) -> bool:
+    """
+    Versión cacheada de user_manager.user_exists para el camino de cada request.
+    
+    Args:
+        username: Nombre del usuario
+        
+    Returns:
+        bool: True si el usuario existe
+    """
+    now = time.monotonic()
+    cached = _user_exists_cache.get(username)
+    if cached and now < cached[1]:
+        return cached[0]
+    
+    exists = user_manager.user_exists(username)
+    if len(_user_exists_cache) >= USER_EXISTS_CACHE_SIZE:
+        _user_exists_cache.clear()
+    _user_exists_cache[username] = (exists, now + USER_EXISTS_TTL)
+    return exists
+
+@lru_cache(maxsize=16)
+def _db_path_for(username: str) -> Path:
+    """Ruta a la BD del usuario, calculada una sola vez por nombre de usuario."""
+    return user_manager.get_user_database_path(username)
+
 class UserContextMiddleware:
     """
     Middleware que inyecta contexto de usuario en todas las requests de Flask.
     """
     
-    def __init__(self, app=None):
+    def __init__(self, app=None, skip_endpoints=frozenset({"static", "healthz"})):
         """
         Inicializa el middleware.
         
         Args:
             app: Instancia de Flask (opcional, se puede configurar después)
+            skip_endpoints: Endpoints que no necesitan contexto de usuario
         """
         self.app = app
+        self._skip_endpoints = frozenset(skip_endpoints)
         if app is not None:
             self.init_app(app)
     
@@ -48,7 +212,8 @@ class UserContextMiddleware:
         """
         self.app = app
         app.before_request(self.load_user_context)
-        app.teardown_appcontext(self.close_user_context)
+        # teardown_request devuelve la conexión al pool en cuanto termina la request
+        app.teardown_request(self.close_user_context)
         
         logger.info("UserContextMiddleware configurado correctamente")
     
@@ -57,6 +222,10 @@ class UserContextMiddleware:
         Carga el contexto de usuario antes de cada request.
         Ejecutado automáticamente por Flask antes de cada endpoint.
         """
+        # Archivos estáticos y health checks no usan el contexto de usuario
+        if request.endpoint in self._skip_endpoints:
+            return
+        
         try:
             # Cargar información del usuario actual
             g.current_user = user_manager.current_user
@@ -64,14 +233,17 @@ class UserContextMiddleware:
             
             # Preparar conexión a BD del usuario (lazy loading)
             g.user_db_connection = None
-            g.user_db_path = user_manager.get_user_database_path()
+            g.user_db_path = _db_path_for(g.current_user)
+            
+            # Cache de preferencias válido solo durante esta request
+            g._prefs_cache = {}
             
             # Verificar que el usuario existe
-            if not user_manager.user_exists(g.current_user):
-                logger.warning(f"Usuario actual no existe: {g.current_user}")
+            if not _user_exists_cached(g.current_user):
+                logger.warning("Usuario actual no existe: %s", g.current_user)
                 # No bloqueamos la request, pero registramos el problema
             
-            logger.debug(f"Contexto de usuario cargado: {g.current_user}")
+            logger.debug("Contexto de usuario cargado: %s", g.current_user)
             
         except Exception as e:
             logger.error(f"Error cargando contexto de usuario: {e}")
@@ -88,10 +260,11 @@ class UserContextMiddleware:
             exception: Excepción si la request falló (opcional)
         """
         try:
-            # Cerrar conexión a BD si está abierta
-            if hasattr(g, 'user_db_connection') and g.user_db_connection:
-                g.user_db_connection.close()
-                logger.debug("Conexión a BD de usuario cerrada")
+            # Cerrar conexión a BD si está abierta (no existe en endpoints omitidos)
+            if getattr(g, 'user_db_connection', None) is not None:
+                _release_connection(g.user_db_connection_path, g.user_db_connection)
+                g.user_db_connection = None
+                logger.debug("Conexión a BD de usuario devuelta al pool")
                 
         except Exception as e:
             logger.error(f"Error cerrando contexto de usuario: {e}")
@@ -99,7 +272,8 @@ class UserContextMiddleware:
 def get_user_db() -> sqlite3.Connection:
     """
     Obtiene la conexión a la base de datos del usuario actual.
-    Utiliza lazy loading para crear la conexión solo cuando se necesite.
+    Utiliza lazy loading para tomar una conexión del pool solo cuando se
+    necesite; close_user_context la devuelve al terminar la request.
     
     Returns:
         sqlite3.Connection: Conexión a la BD del usuario actual
@@ -114,8 +288,10 @@ def get_user_db() -> sqlite3.Connection:
     # Lazy loading de la conexión
     if not hasattr(g, 'user_db_connection') or g.user_db_connection is None:
         try:
-            g.user_db_connection = user_manager.get_user_database_connection(g.current_user)
-            logger.debug(f"Conexión a BD abierta para usuario: {g.current_user}")
+            db_path = str(_db_path_for(g.current_user))
+            g.user_db_connection = _acquire_connection(db_path)
+            g.user_db_connection_path = db_path
+            logger.debug("Conexión a BD abierta para usuario: %s", g.current_user)
         except Exception as e:
             logger.error(f"Error abriendo conexión a BD para {g.current_user}: {e}")
             raise
@@ -126,16 +302,23 @@ def get_current_user() -> str:
     """
     Obtiene el nombre del usuario actual.
     
+    Dentro de una request se usa g.current_user; fuera de Flask (hilos de
+    fondo, CLI) se usa el usuario activo de user_manager, que es global al
+    proceso. No lanza excepciones.
+    
     Returns:
-        str: Nombre del usuario actual
-        
-    Raises:
-        RuntimeError: Si no hay contexto de usuario disponible
+        str: Nombre del usuario actual ("default_user" si no se puede determinar)
     """
-    if not hasattr(g, 'current_user'):
-        raise RuntimeError("No hay contexto de usuario disponible")
+    if has_request_context():
+        current_user = getattr(g, 'current_user', None)
+        if current_user:
+            return current_user
     
-    return g.current_user
+    try:
+        return user_manager.current_user or "default_user"
+    except Exception as e:
+        logger.error(f"Error obteniendo usuario actual: {e}")
+        return "default_user"
 
 def require_user_context(f):
     """
@@ -154,7 +337,7 @@ def require_user_context(f):
             current_user = get_current_user()
             
             # Verificar que el usuario existe
-            if not user_manager.user_exists(current_user):
+            if not _user_exists_cached(current_user):
                 return jsonify({
                     "error": "Usuario actual no válido",
                     "message": f"El usuario '{current_user}' no existe en el sistema"
@@ -188,14 +371,15 @@ def switch_user_context(username: str) -> bool:
         bool: True si el cambio fue exitoso, False en caso contrario
     """
     try:
-        # Verificar que el usuario existe
-        if not user_manager.user_exists(username):
+        # Verificar que el usuario existe (sin cache: puede haberse creado recién)
+        _user_exists_cache.clear()
+        if not _user_exists_cached(username):
             logger.error(f"Intento de cambio a usuario inexistente: {username}")
             return False
         
-        # Cerrar conexión actual si existe
+        # Devolver conexión actual al pool si existe
         if hasattr(g, 'user_db_connection') and g.user_db_connection:
-            g.user_db_connection.close()
+            _release_connection(g.user_db_connection_path, g.user_db_connection)
             g.user_db_connection = None
         
         # Cambiar usuario en el manager
@@ -204,8 +388,10 @@ def switch_user_context(username: str) -> bool:
         if success:
             # Actualizar contexto local
             g.current_user = username
-            g.user_db_path = user_manager.get_user_database_path(username)
-            logger.info(f"Contexto de usuario cambiado a: {username}")
+            _db_path_for.cache_clear()
+            g.user_db_path = _db_path_for(username)
+            g._prefs_cache = {}
+            logger.info("Contexto de usuario cambiado a: %s", username)
         
         return success
         
@@ -213,34 +399,61 @@ def switch_user_context(username: str) -> bool:
         logger.error(f"Error cambiando contexto de usuario a {username}: {e}")
         return False
 
-def get_user_preferences(category: Optional[str] = None) -> Dict[str, Any]:
+def _invalidate_prefs_cache(categories: Iterable[str]):
+    """
+    Descarta de la caché de la request las categorías modificadas, la vista
+    completa (clave None) y las lecturas de varias categorías que las incluyan.
+    """
+    prefs_cache = getattr(g, '_prefs_cache', None) if has_app_context() else None
+    if not prefs_cache:
+        return
+    
+    changed = set(categories)
+    for category in changed:
+        prefs_cache.pop(category, None)
+    prefs_cache.pop(None, None)
+    for key in [k for k in prefs_cache if isinstance(k, frozenset) and not k.isdisjoint(changed)]:
+        del prefs_cache[key]
+
+def get_user_preferences(category: Optional[str] = None,
+                         categories: Optional[Iterable[str]] = None) -> Dict[str, Any]:
     """
     Obtiene las preferencias del usuario actual desde su BD.
     
     Args:
         category: Categoría específica de preferencias (opcional)
+        categories: Conjunto de categorías a leer (opcional); el filtro se
+            hace en SQL y se devuelve {categoría: datos} solo con las que
+            existan en la BD del usuario
         
     Returns:
-        Dict: Preferencias del usuario (todas o de la categoría especificada)
+        Dict: Preferencias del usuario (todas o de la categoría especificada).
+            Es una copia: modificarla no altera la caché de la request.
     """
+    cache_key = frozenset(categories) if categories is not None else category
+    
     try:
-        db = get_user_db()
-        cursor = db.cursor()
+        # Cada categoría se lee una sola vez por request (fuera de Flask no hay caché)
+        prefs_cache = getattr(g, '_prefs_cache', None) if has_app_context() else None
+        if prefs_cache is not None and cache_key in prefs_cache:
+            return copy.deepcopy(prefs_cache[cache_key])
         
-        if category:
+        if categories is not None:
+            # Solo las categorías pedidas, filtradas por SQLite
+            names = tuple(cache_key)
+            rows = get_user_db().execute(_sql_select_categories(len(names)), names).fetchall()
+            preferences = {row["category"]: _loads(row["data"]) for row in rows}
+        elif category:
             # Obtener categoría específica
-            cursor.execute("SELECT data FROM preferences WHERE category = ?", (category,))
-            result = cursor.fetchone()
-            
-            if result:
-                import json
-                return json.loads(result[0])
-            else:
-                return {}
+            row = get_user_db().execute(SQL_SELECT_PREFERENCES, (category,)).fetchone()
+            preferences = _loads(row["data"]) if row else {}
         else:
             # Usar el método híbrido del UserManager para obtener todas las preferencias
-            from .user_manager import user_manager
-            return user_manager.get_user_preferences()
+            preferences = user_manager.get_user_preferences()
+        
+        if prefs_cache is not None:
+            prefs_cache[cache_key] = copy.deepcopy(preferences)
+        return preferences
             
     except Exception as e:
         logger.error(f"Error obteniendo preferencias del usuario: {e}")
@@ -259,19 +472,100 @@ def set_user_preferences(category: str, preferences: Dict[str, Any]) -> bool:
     """
     try:
         db = get_user_db()
-        cursor = db.cursor()
-        
-        import json
-        preferences_json = json.dumps(preferences, ensure_ascii=False)
         
         # Usar UPSERT (INSERT OR REPLACE)
-        cursor.execute("""
-            INSERT OR REPLACE INTO preferences (category, data, updated_at)
-            VALUES (?, ?, CURRENT_TIMESTAMP)
-        """, (category, preferences_json))
-        
+        db.execute(SQL_UPSERT_PREFERENCES, (category, _dumps(preferences)))
         db.commit()
-        logger.info(f"Preferencias actualizadas para usuario {get_current_user()}, categoría: {category}")
+        
+        # Invalidar la categoría y las vistas que la incluyen en esta request
+        _invalidate_prefs_cache((category,))
+        
+        logger.info("Preferencias actualizadas para usuario %s, categoría: %s",
+                    get_current_user(), category)
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error actualizando preferencias: {e}")
+        return False
+
+def set_user_preferences_bulk(items: Dict[str, Dict[str, Any]]) -> bool:
+    """
+    Actualiza varias categorías de preferencias del usuario actual en una
+    sola transacción.
+    
+    Args:
+        items: Diccionario categoría -> datos de preferencias
+        
+    Returns:
+        bool: True si la actualización fue exitosa, False en caso contrario
+    """
+    try:
+        db = get_user_db()
+        
+        rows = [(category, _dumps(preferences))
+                for category, preferences in items.items()]
+        
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(SQL_UPSERT_PREFERENCES, rows)
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        
+        _invalidate_prefs_cache(items)
+        
+        logger.info("Preferencias actualizadas para usuario %s, categorías: %s",
+                    get_current_user(), list(items))
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error actualizando preferencias: {e}")
+        return False
+
+def _merge_patch(target: Dict[str, Any], patch: Dict[str, Any]) -> Dict[str, Any]:
+    """Aplica un merge patch (RFC 7396, igual que json_patch de SQLite)."""
+    result = dict(target)
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        elif isinstance(value, dict):
+            # Si el destino no es un objeto se parte de {}: así también se
+            # eliminan los None anidados del parche
+            current = result.get(key)
+            result[key] = _merge_patch(current if isinstance(current, dict) else {}, value)
+        else:
+            result[key] = value
+    return result
+
+def patch_user_preferences(category: str, patch: Dict[str, Any]) -> bool:
+    """
+    Actualiza solo algunos campos de una categoría de preferencias del
+    usuario actual. Los valores None eliminan la clave (RFC 7396).
+    
+    Con JSON1 la fusión se hace en SQLite en una sola sentencia; si no,
+    se lee, fusiona y guarda desde Python.
+    
+    Args:
+        category: Categoría de preferencias a actualizar
+        patch: Campos a modificar
+        
+    Returns:
+        bool: True si la actualización fue exitosa, False en caso contrario
+    """
+    try:
+        db = get_user_db()
+        
+        if not _json1_available:
+            current = get_user_preferences(category)
+            return set_user_preferences(category, _merge_patch(current, patch))
+        
+        db.execute(SQL_PATCH_PREFERENCES, (category, _dumps(patch)))
+        
+        _invalidate_prefs_cache((category,))
+        
+        logger.info("Preferencias actualizadas para usuario %s, categoría: %s",
+                    get_current_user(), category)
         return True
         
     except Exception as e:
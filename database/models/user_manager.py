@@ -12,17 +12,222 @@ Fecha: 2024-08-18
 Versión: 1.0.0
 """
 
+import copy
 import sqlite3
 import os
+import re
 import json
 import logging
 import shutil
+import subprocess
+import sys
+import time
+import types
+import zipfile
+import atexit
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple, Iterator, Callable
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# orjson es opcional: (de)serializa las preferencias varias veces más rápido
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+if ORJSON_AVAILABLE:
+    def _dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode('utf-8')
+    _loads = orjson.loads
+else:
+    def _dumps(obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+    _loads = json.loads
+
+# zstandard es opcional: permite distribuir default_preferences.json comprimido
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# PRAGMAs aplicados una sola vez a cada conexión cacheada
+CONNECTION_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-20000;
+    PRAGMA mmap_size=268435456;
+"""
+
+# Solo tiene efecto en una BD vacía (antes de activar WAL y crear tablas)
+NEW_DATABASE_PRAGMAS = "PRAGMA page_size=4096;"
+
+# Nombre de usuario: letras, dígitos y guiones bajos (al menos un carácter
+# alfanumérico) y como máximo los 50 caracteres de users.username
+_USERNAME_RE = re.compile(r"\A(?=\w*[^\W_])\w{1,50}\Z")
+
+# Sentencias frecuentes: el mismo texto reutiliza la sentencia preparada en
+# la caché de cada conexión
+SQL_GET_CURRENT_USER = "SELECT value FROM system_settings WHERE key = 'current_user'"
+SQL_SET_CURRENT_USER = """
+    UPDATE system_settings 
+    SET value = ?, updated_at = CURRENT_TIMESTAMP 
+    WHERE key = 'current_user'
+"""
+SQL_USER_COLUMNS = "SELECT username, display_name, created_at, last_login, is_active FROM users"
+
+def _user_row_factory(cursor: sqlite3.Cursor, row: tuple) -> Dict[str, Any]:
+    """row_factory: convierte una fila de SQL_USER_COLUMNS al formato de la API."""
+    return {
+        'username': row[0],
+        'display_name': row[1],
+        'created_at': row[2],
+        'last_login': row[3],
+        'is_active': bool(row[4])
+    }
+
+# Sin ORDER BY: el resultado se vuelca a un dict
+SQL_LIST_PREFERENCES = "SELECT category, data FROM preferences"
+
+# Versión del esquema de la BD de cada usuario (PRAGMA user_version)
+USER_SCHEMA_VERSION = 1
+
+# Esquema completo de la BD de un usuario
+SCHEMA_SQL = f"""
+-- Tabla de preferencias
+CREATE TABLE IF NOT EXISTS preferences (
+    category VARCHAR(50) PRIMARY KEY,
+    data TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Tabla de recordatorios
+CREATE TABLE IF NOT EXISTS reminders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type VARCHAR(20) NOT NULL,
+    name VARCHAR(200) NOT NULL,
+    quantity VARCHAR(100),
+    prescription TEXT,
+    times TEXT NOT NULL,
+    days TEXT NOT NULL,
+    photo_path VARCHAR(500),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_active BOOLEAN DEFAULT TRUE
+);
+
+-- Tabla de contactos
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    display_name VARCHAR(100) NOT NULL,
+    aliases TEXT NOT NULL,
+    platform VARCHAR(20) DEFAULT 'telegram',
+    details VARCHAR(200) NOT NULL,
+    is_emergency BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_active BOOLEAN DEFAULT TRUE
+);
+
+-- Tabla de logs de interacciones
+CREATE TABLE IF NOT EXISTS interaction_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    interaction_type VARCHAR(50) NOT NULL,
+    details TEXT,
+    success BOOLEAN DEFAULT TRUE
+);
+
+-- Índices para mejorar rendimiento
+CREATE INDEX IF NOT EXISTS idx_reminders_active ON reminders (is_active);
+CREATE INDEX IF NOT EXISTS idx_contacts_emergency ON contacts (is_emergency, is_active);
+CREATE INDEX IF NOT EXISTS idx_logs_type_time ON interaction_logs (interaction_type, timestamp);
+
+PRAGMA user_version = {USER_SCHEMA_VERSION};
+"""
+
+_CREATE_USER_DATABASE_SCRIPT = f"BEGIN IMMEDIATE;\n{SCHEMA_SQL}\nCOMMIT;"
+
+# Plantilla de preferencias personales de un usuario nuevo (las técnicas
+# vienen del archivo de configuración)
+_PERSONAL_PREFERENCES_TEMPLATE = {
+    'usuario': {
+        'nombre': '',  # Se completa con el nombre del usuario
+        'edad': 25,
+        'ciudad': '',
+        'timezone': 'America/Guayaquil',
+        'idioma_preferido': 'es',
+        'modo_verbose': False
+    },
+    'contexto_cultural': {
+        'pais': '',
+        'region': '',
+        'tradiciones_conoce': []
+    },
+    'mascotas': {
+        'tiene_mascotas': False,
+        'tipo': '',
+        'nombres': []
+    },
+    'intereses': {
+        'hobbies_principales': [],
+        'musica_preferida': [],
+        'comidas_favoritas': [],
+        'actividades_sociales': [],
+        'entretenimiento': [],
+        'plantas_conoce': []
+    },
+    'religion': {
+        'practica': False,
+        'tipo': ''
+    },
+    'ejemplos_personalizacion': {
+        'frases_cercanas': [],
+        'cuando_hablar_comida': {
+            'contexto': '',
+            'incluir': []
+        },
+        'cuando_hablar_entretenimiento': {
+            'contexto': '',
+            'incluir': []
+        },
+        'cuando_hablar_mascotas': {
+            'contexto': '',
+            'incluir': []
+        },
+        'cuando_hablar_plantas': {
+            'contexto': '',
+            'incluir': []
+        }
+    }
+}
+
+# Configuraciones mínimas de fallback si no se puede cargar el archivo
+# (vista de solo lectura: se comparte entre todas las llamadas)
+_FALLBACK_DEFAULTS = types.MappingProxyType({
+    'ia_generativa': {
+        'habilitada': True,
+        'confianza_minima_clasica': 0.85,
+        'temperatura': 0.3,
+        'max_tokens_respuesta': 150
+    },
+    'asistente': {
+        'personalidad': 'amigable_profesional',
+        'usar_emojis': False,
+        'respuestas_cortas': True
+    },
+    'comandos_clasicos': {
+        'siempre_preferir': ['recordatorio', 'medicacion', 'contacto_emergencia', 'fecha', 'hora', 'enchufe'],
+        'nunca_derivar_ia': ['emergencia', 'medicacion_critica', 'sistema_apagar']
+    }
+})
+
 class UserManager:
     """
     Gestor principal de usuarios del sistema.
@@ -30,6 +235,9 @@ class UserManager:
     y acceso a bases de datos individuales.
     """
     
+    # ((archivo, st_mtime_ns), configuración) de default_preferences ya parseado
+    _defaults_cache: Optional[Tuple[Tuple[str, int], Dict[str, Any]]] = None
+    
     def __init__(self, base_path: str = None):
         """
         Inicializa el gestor de usuarios.
@@ -42,32 +250,173 @@ class UserManager:
         self.users_path = self.data_path / "users"
         self.system_path = self.data_path / "system"
         self.backups_path = self.data_path / "backups"
+        # Directorios de usuarios eliminados pendientes de borrado en segundo plano
+        self.trash_path = self.users_path / ".trash"
+        self._system_db = str(self.system_path / "users_registry.db")
+        
+        # usuario -> (directorio, ruta de BD, ruta de BD como str)
+        self._user_paths_cache: Dict[str, Tuple[Path, Path, str]] = {}
+        
+        # Una conexión reutilizable por archivo de BD (registro y usuarios)
+        self._conns: Dict[str, sqlite3.Connection] = {}
+        self._conns_lock = threading.Lock()
+        self._tx_lock = threading.RLock()
+        atexit.register(self.close)
+        
+        # Funciones a llamar con la ruta de la BD de un usuario eliminado, para
+        # que otros módulos descarten las conexiones que tengan abiertas a ella
+        self._user_deleted_callbacks: List[Callable[[str], None]] = []
+        
+        # Directorios, BD del sistema y usuario actual se preparan en el
+        # primer uso (ver _ensure_ready), no al construir la instancia
+        self._ready = False
+        self._initializing = False
+        self._ready_lock = threading.RLock()
+        self._current_user: Optional[str] = None
+    
+    def _ensure_ready(self):
+        """Crea directorios, inicializa la BD del sistema y carga el usuario actual (una vez)."""
+        if self._ready:
+            return
+        
+        with self._ready_lock:
+            # _initializing evita reentrar desde el propio proceso de inicialización
+            if self._ready or self._initializing:
+                return
+            self._initializing = True
+            try:
+                # Crear directorios si no existen
+                self._ensure_directories()
+                
+                # Inicializar BD del sistema
+                self._init_system_database()
+                
+                # Cargar usuario actual
+                self._current_user = self._get_current_user()
+                self._ready = True
+                
+                # Terminar borrados que quedaron a medias en una ejecución anterior
+                stale = list(self.trash_path.iterdir())
+                if stale:
+                    threading.Thread(target=self._empty_trash, args=(stale,), daemon=True).start()
+            finally:
+                self._initializing = False
+            
+            logger.info(f"UserManager inicializado. Usuario actual: {self._current_user}")
+    
+    @property
+    def current_user(self) -> str:
+        """Usuario actualmente activo (carga el registro en el primer acceso)."""
+        self._ensure_ready()
+        return self._current_user
+    
+    @current_user.setter
+    def current_user(self, username: str):
+        self._current_user = username
+    
+    def _conn(self, db_path) -> sqlite3.Connection:
+        """
+        Obtiene la conexión cacheada a una BD, abriéndola en el primer uso.
         
-        # Crear directorios si no existen
-        self._ensure_directories()
+        Args:
+            db_path: Ruta al archivo de base de datos
+            
+        Returns:
+            sqlite3.Connection: Conexión en modo autocommit compartida entre hilos.
+                Usarla solo dentro de _locked o _transaction.
+        """
+        key = str(db_path)
+        conn = self._conns.get(key)
+        if conn is not None:
+            return conn
+        
+        self._ensure_ready()
+        
+        with self._conns_lock:
+            conn = self._conns.get(key)
+            if conn is None:
+                is_new = not os.path.exists(key)
+                conn = sqlite3.connect(key, check_same_thread=False, isolation_level=None)
+                if is_new:
+                    conn.executescript(NEW_DATABASE_PRAGMAS)
+                conn.executescript(CONNECTION_PRAGMAS)
+                self._conns[key] = conn
+        return conn
+    
+    @contextmanager
+    def _locked(self, db_path):
+        """
+        Da acceso exclusivo a la conexión cacheada para sentencias sueltas.
         
-        # Inicializar BD del sistema
-        self._init_system_database()
+        La conexión es compartida: sin el bloqueo, una escritura de otro hilo
+        quedaría dentro de una transacción abierta por _transaction y se
+        perdería con su ROLLBACK.
+        
+        Args:
+            db_path: Ruta al archivo de base de datos
+        """
+        # La conexión se obtiene antes de tomar el bloqueo: _conn puede
+        # inicializar el gestor, que también usa _tx_lock
+        conn = self._conn(db_path)
+        with self._tx_lock:
+            yield conn
+    
+    @contextmanager
+    def _transaction(self, db_path):
+        """
+        Agrupa varias escrituras sobre la conexión cacheada en una sola
+        transacción (un único commit/fsync). Se abre con BEGIN IMMEDIATE para
+        tomar el bloqueo de escritura desde el inicio.
         
-        # Cargar usuario actual
-        self.current_user = self._get_current_user()
+        Args:
+            db_path: Ruta al archivo de base de datos
+        """
+        conn = self._conn(db_path)
+        with self._tx_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+    
+    def _close_conn(self, db_path):
+        """Cierra y descarta la conexión cacheada a una BD (si existe)."""
+        with self._conns_lock:
+            conn = self._conns.pop(str(db_path), None)
+        if conn is not None:
+            conn.close()
+    
+    def on_user_deleted(self, callback: Callable[[str], None]):
+        """
+        Registra una función que se llama al eliminar un usuario.
         
-        logger.info(f"UserManager inicializado. Usuario actual: {self.current_user}")
+        Args:
+            callback: Recibe la ruta (str) de la BD del usuario eliminado
+        """
+        self._user_deleted_callbacks.append(callback)
+    
+    def close(self):
+        """Cierra todas las conexiones cacheadas."""
+        with self._conns_lock:
+            conns = list(self._conns.values())
+            self._conns.clear()
+        for conn in conns:
+            conn.close()
     
     def _ensure_directories(self):
         """Asegura que todos los directorios necesarios existan."""
-        for path in [self.users_path, self.system_path, self.backups_path]:
+        for path in [self.users_path, self.system_path, self.backups_path, self.trash_path]:
             path.mkdir(parents=True, exist_ok=True)
     
     def _init_system_database(self):
         """Inicializa la base de datos del sistema para registro de usuarios."""
-        system_db_path = self.system_path / "users_registry.db"
+        system_db_path = self._system_db
         
-        with sqlite3.connect(system_db_path) as conn:
-            cursor = conn.cursor()
-            
+        with self._transaction(system_db_path) as conn:
             # Tabla de usuarios registrados
-            cursor.execute("""
+            conn.execute("""
                 CREATE TABLE IF NOT EXISTS users (
                     username VARCHAR(50) PRIMARY KEY,
                     display_name VARCHAR(100) NOT NULL,
@@ -80,7 +429,7 @@ class UserManager:
             """)
             
             # Tabla de configuración del sistema
-            cursor.execute("""
+            conn.execute("""
                 CREATE TABLE IF NOT EXISTS system_settings (
                     key VARCHAR(50) PRIMARY KEY,
                     value TEXT NOT NULL,
@@ -88,50 +437,52 @@ class UserManager:
                 )
             """)
             
-            # Configuración inicial si no existe
-            cursor.execute("SELECT COUNT(*) FROM system_settings WHERE key = 'current_user'")
-            if cursor.fetchone()[0] == 0:
-                cursor.execute("""
-                    INSERT INTO system_settings (key, value) VALUES 
-                    ('current_user', 'francisca'),
-                    ('auto_backup_days', '7'),
-                    ('max_users', '10')
-                """)
-            
-            conn.commit()
+            # Configuración inicial si no existe (idempotente por la PRIMARY KEY)
+            conn.execute("""
+                INSERT OR IGNORE INTO system_settings (key, value) VALUES 
+                ('current_user', 'francisca'),
+                ('auto_backup_days', '7'),
+                ('max_users', '10')
+            """)
         
         logger.info("Base de datos del sistema inicializada correctamente")
     
     def _get_current_user(self) -> str:
         """Obtiene el usuario actualmente activo del sistema."""
-        system_db_path = self.system_path / "users_registry.db"
+        system_db_path = self._system_db
         
         try:
-            with sqlite3.connect(system_db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT value FROM system_settings WHERE key = 'current_user'")
-                result = cursor.fetchone()
-                return result[0] if result else 'francisca'
+            with self._locked(system_db_path) as conn:
+                result = conn.execute(SQL_GET_CURRENT_USER).fetchone()
+            return result[0] if result else 'francisca'
         except Exception as e:
-            logger.error(f"Error obteniendo usuario actual: {e}")
+            logger.error("Error obteniendo usuario actual: %s", e)
             return 'francisca'  # Usuario por defecto
     
     def _set_current_user(self, username: str):
         """Establece el usuario activo del sistema."""
-        system_db_path = self.system_path / "users_registry.db"
+        system_db_path = self._system_db
         
-        with sqlite3.connect(system_db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE system_settings 
-                SET value = ?, updated_at = CURRENT_TIMESTAMP 
-                WHERE key = 'current_user'
-            """, (username,))
-            conn.commit()
+        with self._locked(system_db_path) as conn:
+            conn.execute(SQL_SET_CURRENT_USER, (username,))
         
         # Actualizar también en memoria
         self.current_user = username
-        logger.info(f"Usuario actual cambiado a: {username}")
+        logger.info("Usuario actual cambiado a: %s", username)
+    
+    def _user_paths(self, user: str) -> Tuple[Path, Path, str]:
+        """Rutas del usuario, calculadas una sola vez por nombre de usuario."""
+        paths = self._user_paths_cache.get(user)
+        if paths is None:
+            user_dir = self.users_path / user
+            db_path = user_dir / "user_data.db"
+            paths = (user_dir, db_path, str(db_path))
+            self._user_paths_cache[user] = paths
+        return paths
+    
+    def _user_db_str(self, username: str = None) -> str:
+        """Ruta a la BD del usuario como str (lo que usan sqlite3 y la caché de conexiones)."""
+        return self._user_paths(username or self.current_user)[2]
     
     def get_user_database_path(self, username: str = None) -> Path:
         """
@@ -143,8 +494,7 @@ class UserManager:
         Returns:
             Path: Ruta al archivo de base de datos del usuario.
         """
-        user = username or self.current_user
-        return self.users_path / user / "user_data.db"
+        return self._user_paths(username or self.current_user)[1]
     
     def get_user_directory(self, username: str = None) -> Path:
         """
@@ -156,8 +506,30 @@ class UserManager:
         Returns:
             Path: Ruta al directorio del usuario.
         """
-        user = username or self.current_user
-        return self.users_path / user
+        return self._user_paths(username or self.current_user)[0]
+    
+    @staticmethod
+    def _fast_rmtree(path: Path):
+        """
+        Elimina un árbol de directorios. En POSIX delega en `rm -rf`, mucho
+        más rápido que shutil.rmtree con muchos archivos (p. ej. uploads).
+        
+        Args:
+            path: Directorio a eliminar
+        """
+        rm = shutil.which("rm") if sys.platform != "win32" else None
+        if rm:
+            subprocess.run([rm, "-rf", "--", str(path)], check=True)
+        else:
+            shutil.rmtree(path)
+    
+    def _empty_trash(self, entries: List[Path]):
+        """Elimina directorios movidos a la papelera (se ejecuta en segundo plano)."""
+        for entry in entries:
+            try:
+                self._fast_rmtree(entry)
+            except Exception as e:
+                logger.error(f"Error eliminando {entry}: {e}")
     
     def delete_user(self, username: str) -> bool:
         """
@@ -170,26 +542,37 @@ class UserManager:
             bool: True si la eliminación fue exitosa, False en caso contrario
         """
         try:
-            if not self.user_exists(username):
-                logger.error(f"No se puede eliminar usuario inexistente: {username}")
-                return False
-            
             # No permitir eliminar el usuario actual
             if username == self.current_user:
                 logger.error(f"No se puede eliminar el usuario actualmente activo: {username}")
                 return False
             
-            # Eliminar del registro del sistema
-            system_db_path = self.system_path / "users_registry.db"
-            with sqlite3.connect(system_db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM users WHERE username = ?", (username,))
-                conn.commit()
+            # Eliminar del registro del sistema (rowcount 0 = no existía)
+            system_db_path = self._system_db
+            with self._locked(system_db_path) as conn:
+                deleted = conn.execute(
+                    "DELETE FROM users WHERE username = ? AND is_active = TRUE", (username,)).rowcount
+            if deleted == 0:
+                logger.error(f"No se puede eliminar usuario inexistente: {username}")
+                return False
             
-            # Eliminar directorio de datos del usuario
+            # Soltar las conexiones abiertas (propias y de otros módulos) antes
+            # de borrar el archivo de BD
+            db_path = self._user_db_str(username)
+            self._close_conn(db_path)
+            for callback in self._user_deleted_callbacks:
+                try:
+                    callback(db_path)
+                except Exception as e:
+                    logger.error(f"Error liberando conexiones de {username}: {e}")
+            
+            # Eliminar directorio de datos del usuario: moverlo a la papelera
+            # (rename atómico) y borrarlo en segundo plano
             user_dir = self.get_user_directory(username)
             if user_dir.exists():
-                shutil.rmtree(user_dir)
+                trash_target = self.trash_path / f"{username}_{time.time_ns()}"
+                os.replace(user_dir, trash_target)
+                threading.Thread(target=self._empty_trash, args=([trash_target],), daemon=True).start()
             
             logger.info(f"Usuario eliminado exitosamente: {username}")
             return True
@@ -198,48 +581,6 @@ class UserManager:
             logger.error(f"Error eliminando usuario {username}: {e}")
             return False
     
-    def backup_user_data(self, username: str) -> bool:
-        """
-        Crea un backup de los datos del usuario.
-        
-        Args:
-            username: Nombre del usuario a respaldar
-            
-        Returns:
-            bool: True si el backup fue exitoso, False en caso contrario
-        """
-        try:
-            if not self.user_exists(username):
-                logger.error(f"No se puede hacer backup de usuario inexistente: {username}")
-                return False
-            
-            # Crear directorio de backup
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_dir = self.backups_path / f"user_{username}_{timestamp}"
-            backup_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Copiar datos del usuario
-            user_dir = self.get_user_directory(username)
-            if user_dir.exists():
-                backup_user_dir = backup_dir / "user_data"
-                shutil.copytree(user_dir, backup_user_dir)
-            
-            # Guardar información del usuario desde el registro
-            users_list = self.get_users_list()
-            user_info = next((u for u in users_list if u['username'] == username), None)
-            
-            if user_info:
-                backup_info = backup_dir / "user_info.json"
-                with open(backup_info, 'w', encoding='utf-8') as f:
-                    json.dump(user_info, f, indent=2, ensure_ascii=False)
-            
-            logger.info(f"Backup creado exitosamente para {username}: {backup_dir}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error creando backup para {username}: {e}")
-            return False
-    
     def user_exists(self, username: str) -> bool:
         """
         Verifica si un usuario existe en el sistema.
@@ -250,13 +591,13 @@ class UserManager:
         Returns:
             bool: True si el usuario existe, False en caso contrario.
         """
-        system_db_path = self.system_path / "users_registry.db"
+        system_db_path = self._system_db
         
         try:
-            with sqlite3.connect(system_db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT COUNT(*) FROM users WHERE username = ? AND is_active = TRUE", (username,))
-                return cursor.fetchone()[0] > 0
+            with self._locked(system_db_path) as conn:
+                return conn.execute(
+                    "SELECT 1 FROM users WHERE username = ? AND is_active = TRUE LIMIT 1", (username,)
+                ).fetchone() is not None
         except Exception as e:
             logger.error(f"Error verificando existencia del usuario {username}: {e}")
             return False
@@ -272,19 +613,27 @@ class UserManager:
         Returns:
             bool: True si el usuario se creó exitosamente, False en caso contrario.
         """
+        system_db_path = self._system_db
+        registered = False
         try:
             # Validar nombre de usuario
-            if not username.replace('_', '').isalnum():
+            if _USERNAME_RE.match(username) is None:
                 logger.error(f"Nombre de usuario inválido: {username}")
                 return False
             
-            # Verificar que no exista
-            if self.user_exists(username):
+            # Registrar usuario en el sistema; si ya existe no se inserta nada
+            user_dir = self.get_user_directory(username)
+            with self._locked(system_db_path) as conn:
+                inserted = conn.execute("""
+                    INSERT OR IGNORE INTO users (username, display_name, data_directory, created_at)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                """, (username, display_name, str(user_dir))).rowcount
+            if inserted == 0:
                 logger.error(f"El usuario {username} ya existe")
                 return False
+            registered = True
             
             # Crear directorio del usuario
-            user_dir = self.get_user_directory(username)
             user_dir.mkdir(parents=True, exist_ok=True)
             
             # Crear subdirectorios
@@ -293,16 +642,6 @@ class UserManager:
             # Crear base de datos del usuario
             self._create_user_database(username)
             
-            # Registrar usuario en el sistema
-            system_db_path = self.system_path / "users_registry.db"
-            with sqlite3.connect(system_db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO users (username, display_name, data_directory, created_at)
-                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-                """, (username, display_name, str(user_dir)))
-                conn.commit()
-            
             # Inicializar preferencias por defecto
             self._initialize_user_preferences(username)
             
@@ -311,178 +650,100 @@ class UserManager:
             
         except Exception as e:
             logger.error(f"Error creando usuario {username}: {e}")
+            if registered:
+                # No dejar en el registro un usuario sin datos
+                try:
+                    with self._locked(system_db_path) as conn:
+                        conn.execute("DELETE FROM users WHERE username = ?", (username,))
+                except sqlite3.Error as cleanup_error:
+                    logger.error(f"Error revirtiendo registro de {username}: {cleanup_error}")
             return False
     
     def _create_user_database(self, username: str):
         """Crea la base de datos individual del usuario."""
-        db_path = self.get_user_database_path(username)
-        
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Tabla de preferencias
-            cursor.execute("""
-                CREATE TABLE preferences (
-                    category VARCHAR(50) PRIMARY KEY,
-                    data TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Tabla de recordatorios
-            cursor.execute("""
-                CREATE TABLE reminders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    type VARCHAR(20) NOT NULL,
-                    name VARCHAR(200) NOT NULL,
-                    quantity VARCHAR(100),
-                    prescription TEXT,
-                    times TEXT NOT NULL,
-                    days TEXT NOT NULL,
-                    photo_path VARCHAR(500),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT TRUE
-                )
-            """)
-            
-            # Tabla de contactos
-            cursor.execute("""
-                CREATE TABLE contacts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    display_name VARCHAR(100) NOT NULL,
-                    aliases TEXT NOT NULL,
-                    platform VARCHAR(20) DEFAULT 'telegram',
-                    details VARCHAR(200) NOT NULL,
-                    is_emergency BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT TRUE
-                )
-            """)
-            
-            # Tabla de logs de interacciones
-            cursor.execute("""
-                CREATE TABLE interaction_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    interaction_type VARCHAR(50) NOT NULL,
-                    details TEXT,
-                    success BOOLEAN DEFAULT TRUE
-                )
-            """)
-            
-            # Índices para mejorar rendimiento
-            cursor.execute("CREATE INDEX idx_reminders_active ON reminders (is_active)")
-            cursor.execute("CREATE INDEX idx_contacts_emergency ON contacts (is_emergency, is_active)")
-            cursor.execute("CREATE INDEX idx_logs_type_time ON interaction_logs (interaction_type, timestamp)")
-            
-            conn.commit()
+        db_path = self._user_db_str(username)
+        
+        # executescript hace COMMIT de cualquier transacción abierta, así que
+        # BEGIN/COMMIT van dentro del propio script (todo el esquema en una
+        # sola transacción)
+        with self._locked(db_path) as conn:
+            try:
+                conn.executescript(_CREATE_USER_DATABASE_SCRIPT)
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
         
         logger.info(f"Base de datos creada para usuario: {username}")
     
     def _load_default_preferences(self) -> Dict[str, Any]:
-        """Carga las configuraciones por defecto desde el archivo de configuración."""
+        """
+        Carga las configuraciones por defecto.
+        
+        Se toman del módulo default_preferences; si no está disponible se usa
+        el archivo default_preferences.json. El contenido del archivo se
+        cachea y solo se vuelve a leer si cambia su fecha de modificación. Si
+        zstandard está instalado y existe default_preferences.json.zst, se usa
+        esa versión comprimida.
+        """
+        try:
+            from . import default_preferences
+            return default_preferences.DEFAULT_PREFERENCES
+        except ImportError:
+            pass
+        
         try:
             default_file = Path(__file__).parent / "default_preferences.json"
-            if default_file.exists():
-                with open(default_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    return config.get('default_preferences', {})
-            else:
+            if ZSTD_AVAILABLE:
+                compressed_file = default_file.with_name(default_file.name + ".zst")
+                if compressed_file.exists():
+                    default_file = compressed_file
+            
+            try:
+                cache_key = (default_file.name, default_file.stat().st_mtime_ns)
+            except FileNotFoundError:
                 logger.warning(f"Archivo de configuración por defecto no encontrado: {default_file}")
                 return self._get_fallback_defaults()
+            
+            cached = UserManager._defaults_cache
+            if cached and cached[0] == cache_key:
+                return cached[1]
+            
+            data = default_file.read_bytes()
+            if default_file.suffix == ".zst":
+                data = zstandard.ZstdDecompressor().decompress(data)
+            config = _loads(data)
+            defaults = config.get('default_preferences', {})
+            UserManager._defaults_cache = (cache_key, defaults)
+            return defaults
         except Exception as e:
             logger.error(f"Error cargando configuraciones por defecto: {e}")
             return self._get_fallback_defaults()
     
     def _get_fallback_defaults(self) -> Dict[str, Any]:
         """Configuraciones mínimas de fallback si no se puede cargar el archivo."""
-        return {
-            'ia_generativa': {
-                'habilitada': True,
-                'confianza_minima_clasica': 0.85,
-                'temperatura': 0.3,
-                'max_tokens_respuesta': 150
-            },
-            'asistente': {
-                'personalidad': 'amigable_profesional',
-                'usar_emojis': False,
-                'respuestas_cortas': True
-            },
-            'comandos_clasicos': {
-                'siempre_preferir': ['recordatorio', 'medicacion', 'contacto_emergencia', 'fecha', 'hora', 'enchufe'],
-                'nunca_derivar_ia': ['emergencia', 'medicacion_critica', 'sistema_apagar']
-            }
-        }
+        return _FALLBACK_DEFAULTS
     
     def _initialize_user_preferences(self, username: str):
         """Inicializa solo las preferencias personales para un nuevo usuario."""
-        db_path = self.get_user_database_path(username)
-        
-        # Solo preferencias personales (las técnicas vienen del archivo de configuración)
-        personal_preferences = {
-            'usuario': {
-                'nombre': username.title(),
-                'edad': 25,
-                'ciudad': '',
-                'timezone': 'America/Guayaquil',
-                'idioma_preferido': 'es',
-                'modo_verbose': False
-            },
-            'contexto_cultural': {
-                'pais': '',
-                'region': '',
-                'tradiciones_conoce': []
-            },
-            'mascotas': {
-                'tiene_mascotas': False,
-                'tipo': '',
-                'nombres': []
-            },
-            'intereses': {
-                'hobbies_principales': [],
-                'musica_preferida': [],
-                'comidas_favoritas': [],
-                'actividades_sociales': [],
-                'entretenimiento': [],
-                'plantas_conoce': []
-            },
-            'religion': {
-                'practica': False,
-                'tipo': ''
-            },
-            'ejemplos_personalizacion': {
-                'frases_cercanas': [],
-                'cuando_hablar_comida': {
-                    'contexto': '',
-                    'incluir': []
-                },
-                'cuando_hablar_entretenimiento': {
-                    'contexto': '',
-                    'incluir': []
-                },
-                'cuando_hablar_mascotas': {
-                    'contexto': '',
-                    'incluir': []
-                },
-                'cuando_hablar_plantas': {
-                    'contexto': '',
-                    'incluir': []
-                }
-            }
-        }
+        db_path = self._user_db_str(username)
+        
+        # Copia superficial: solo 'usuario' cambia por usuario, el resto se
+        # serializa tal cual desde la plantilla
+        personal_preferences = dict(_PERSONAL_PREFERENCES_TEMPLATE)
+        personal_preferences['usuario'] = dict(personal_preferences['usuario'],
+                                               nombre=username.title())
+        
+        # Serializar fuera de la transacción para acortar el bloqueo de escritura
+        rows = [(category, _dumps(data))
+                for category, data in personal_preferences.items()]
         
         try:
-            with sqlite3.connect(db_path) as conn:
-                cursor = conn.cursor()
-                
-                for category, data in personal_preferences.items():
-                    cursor.execute("""
-                        INSERT INTO preferences (category, data, created_at, updated_at)
-                        VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-                    """, (category, json.dumps(data, ensure_ascii=False)))
-                
-                conn.commit()
+            with self._transaction(db_path) as conn:
+                conn.executemany("""
+                    INSERT INTO preferences (category, data, created_at, updated_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                """, rows)
             
             logger.info(f"Preferencias personales inicializadas para: {username} (6 categorías)")
             
@@ -504,7 +765,7 @@ class UserManager:
         
         if not username:
             logger.error("No hay usuario actual establecido")
-            return self._load_default_preferences()
+            return copy.deepcopy(self._load_default_preferences())
         
         # Cargar configuraciones por defecto (técnicas)
         default_preferences = self._load_default_preferences()
@@ -512,32 +773,44 @@ class UserManager:
         # Cargar preferencias personales del usuario
         user_preferences = self._get_user_personal_preferences(username)
         
-        # Combinar: personales sobrescriben a las por defecto
-        combined_preferences = default_preferences.copy()
+        # Combinar: personales sobrescriben a las por defecto. Copia profunda:
+        # las categorías por defecto son objetos compartidos a nivel de módulo
+        # y el llamador puede modificar lo que recibe
+        combined_preferences = copy.deepcopy(default_preferences)
         combined_preferences.update(user_preferences)
         
         return combined_preferences
-    
+
+    def get_user_preferences_mtime(self, username: str = None) -> tuple:
+        """
+        Huella de las preferencias del usuario: fecha de modificación y tamaño
+        de su BD y de su WAL (en modo WAL las escrituras no tocan el archivo
+        principal hasta el checkpoint).
+
+        Args:
+            username: Nombre del usuario. Si no se especifica, usa el usuario actual.
+
+        Returns:
+            tuple: Cambia cada vez que se escriben las preferencias del usuario.
+        """
+        db_file = self._user_db_str(username)
+        version = []
+        for path in (db_file, db_file + "-wal"):
+            try:
+                st = os.stat(path)
+                version.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                version.append(None)
+        return tuple(version)
+
     def _get_user_personal_preferences(self, username: str) -> Dict[str, Any]:
         """Obtiene solo las preferencias personales del usuario desde su BD."""
-        db_path = self.get_user_database_path(username)
+        db_path = self._user_db_str(username)
         
         try:
-            with sqlite3.connect(db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT category, data 
-                    FROM preferences 
-                    ORDER BY category
-                """)
-                
-                preferences = {}
-                for row in cursor.fetchall():
-                    category = row[0]
-                    data = json.loads(row[1])
-                    preferences[category] = data
-                
-                return preferences
+            with self._locked(db_path) as conn:
+                rows = conn.execute(SQL_LIST_PREFERENCES).fetchall()
+            return {category: _loads(data) for category, data in rows}
                 
         except Exception as e:
             logger.error(f"Error obteniendo preferencias personales de {username}: {e}")
@@ -550,33 +823,34 @@ class UserManager:
         Returns:
             List[Dict]: Lista de usuarios con su información.
         """
-        system_db_path = self.system_path / "users_registry.db"
+        system_db_path = self._system_db
         
         try:
-            with sqlite3.connect(system_db_path) as conn:
+            with self._locked(system_db_path) as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT username, display_name, created_at, last_login, is_active 
-                    FROM users 
-                    ORDER BY created_at DESC
-                """)
-                
-                users = []
-                for row in cursor.fetchall():
-                    users.append({
-                        'username': row[0],
-                        'display_name': row[1],
-                        'created_at': row[2],
-                        'last_login': row[3],
-                        'is_active': bool(row[4])
-                    })
-                
-                return users
+                cursor.row_factory = _user_row_factory
+                return cursor.execute(SQL_USER_COLUMNS + " ORDER BY created_at DESC").fetchall()
                 
         except Exception as e:
             logger.error(f"Error obteniendo lista de usuarios: {e}")
             return []
     
+    def _get_user_info(self, username: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene el registro de un usuario por su nombre (búsqueda por clave primaria).
+        
+        Args:
+            username: Nombre del usuario
+            
+        Returns:
+            Dict con la información del usuario, o None si no existe
+        """
+        system_db_path = self._system_db
+        with self._locked(system_db_path) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = _user_row_factory
+            return cursor.execute(SQL_USER_COLUMNS + " WHERE username = ?", (username,)).fetchone()
+    
     def switch_user(self, username: str) -> bool:
         """
         Cambia el usuario activo del sistema.
@@ -588,29 +862,26 @@ class UserManager:
             bool: True si el cambio fue exitoso, False en caso contrario.
         """
         try:
-            if not self.user_exists(username):
-                logger.error(f"No se puede cambiar a usuario inexistente: {username}")
-                return False
-            
-            # Actualizar último login
-            system_db_path = self.system_path / "users_registry.db"
-            with sqlite3.connect(system_db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
+            # Actualizar último login (rowcount 0 = el usuario no existe)
+            system_db_path = self._system_db
+            with self._locked(system_db_path) as conn:
+                updated = conn.execute("""
                     UPDATE users 
                     SET last_login = CURRENT_TIMESTAMP 
-                    WHERE username = ?
-                """, (username,))
-                conn.commit()
+                    WHERE username = ? AND is_active = TRUE
+                """, (username,)).rowcount
+            if updated == 0:
+                logger.error("No se puede cambiar a usuario inexistente: %s", username)
+                return False
             
             # Cambiar usuario activo
             self._set_current_user(username)
             
-            logger.info(f"Usuario cambiado exitosamente a: {username}")
+            logger.info("Usuario cambiado exitosamente a: %s", username)
             return True
             
         except Exception as e:
-            logger.error(f"Error cambiando a usuario {username}: {e}")
+            logger.error("Error cambiando a usuario %s: %s", username, e)
             return False
     
     def get_user_database_connection(self, username: str = None) -> sqlite3.Connection:
@@ -623,12 +894,36 @@ class UserManager:
         Returns:
             sqlite3.Connection: Conexión a la base de datos del usuario.
         """
-        db_path = self.get_user_database_path(username)
+        db_path = self._user_db_str(username)
         return sqlite3.connect(db_path)
     
+    @staticmethod
+    def _scandir_walk(root: str, prefix: str = "") -> Iterator[Tuple[str, str]]:
+        """
+        Recorre un árbol con os.scandir (sin stat() extra por entrada).
+        
+        Args:
+            root: Directorio a recorrer
+            prefix: Prefijo del nombre dentro del archivo
+            
+        Yields:
+            (ruta completa, nombre dentro del archivo) de cada directorio y archivo
+        """
+        with os.scandir(root) as entries:
+            for entry in entries:
+                arcname = prefix + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    yield entry.path, arcname + "/"
+                    yield from UserManager._scandir_walk(entry.path, arcname + "/")
+                elif entry.is_file():
+                    yield entry.path, arcname
+    
     def backup_user_data(self, username: str = None) -> bool:
         """
-        Crea un backup de los datos del usuario.
+        Crea un backup comprimido (.zip) de los datos del usuario.
+        
+        Los archivos se guardan sin recomprimir (ZIP_STORED): la mayoría son
+        fotos ya comprimidas. Incluye también user_info.json con su registro.
         
         Args:
             username: Nombre del usuario. Si no se especifica, usa el usuario actual.
@@ -636,29 +931,52 @@ class UserManager:
         Returns:
             bool: True si el backup fue exitoso, False en caso contrario.
         """
+        self._ensure_ready()
+        user = username or self.current_user
         try:
-            user = username or self.current_user
             user_dir = self.get_user_directory(user)
             
             if not user_dir.exists():
                 logger.error(f"Directorio del usuario {user} no existe")
                 return False
             
+            # Volcar el WAL a la BD para que el archivo copiado esté completo
+            db_key = self._user_db_str(user)
+            if db_key in self._conns:
+                with self._locked(db_key) as conn:
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            
             # Crear nombre del backup
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             backup_name = f"{user}_{timestamp}.zip"
             backup_path = self.backups_path / backup_name
             
-            # Crear backup (usando shutil para comprimir)
-            shutil.make_archive(str(backup_path.with_suffix('')), 'zip', str(user_dir))
+            with zipfile.ZipFile(backup_path, "w", compression=zipfile.ZIP_STORED,
+                                 allowZip64=True) as zf:
+                for full_path, arcname in self._scandir_walk(str(user_dir)):
+                    zf.write(full_path, arcname)
+                
+                # Guardar información del usuario desde el registro
+                user_info = self._get_user_info(user)
+                if user_info:
+                    zf.writestr("user_info.json",
+                                json.dumps(user_info, indent=2, ensure_ascii=False))
             
             logger.info(f"Backup creado: {backup_path}")
             return True
             
         except Exception as e:
-            logger.error(f"Error creando backup para {username}: {e}")
+            logger.error(f"Error creando backup para {user}: {e}")
             return False
 
+@lru_cache(maxsize=1)
+def get_user_manager() -> UserManager:
+    """Devuelve la instancia global del gestor de usuarios, creándola en el primer uso."""
+    return UserManager()
 
-# Instancia global del gestor de usuarios
-user_manager = UserManager()
\ No newline at end of file
+def __getattr__(name: str):
+    # Compatibilidad: `from database.models.user_manager import user_manager`
+    # sigue funcionando, pero la instancia solo se crea cuando se pide
+    if name == "user_manager":
+        return get_user_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
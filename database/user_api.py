@@ -16,26 +16,272 @@ Versión: 2.0.0 - Sistema híbrido compartido
 
 import logging
 import json
-from flask import Blueprint, request, jsonify, g
-from datetime import datetime
-from typing import Dict, Any, List
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from flask import Blueprint, request, jsonify, g, current_app
+from typing import Dict, Any, List, Tuple
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from database.models.user_manager import user_manager
+from database.models.user_manager import user_manager, _USERNAME_RE
 from database.models.user_context import (
     require_user_context, 
     get_current_user, 
     get_user_db,
     switch_user_context,
     get_user_preferences,
-    set_user_preferences
+    set_user_preferences,
+    set_user_preferences_bulk
 )
 
 logger = logging.getLogger(__name__)
 
+# orjson es opcional: serializa las respuestas JSON varias veces más rápido
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:  # Flask < 2.2
+    DefaultJSONProvider = None
+
+if ORJSON_AVAILABLE and DefaultJSONProvider is not None:
+    class OrjsonProvider(DefaultJSONProvider):
+        """Proveedor JSON de Flask que usa orjson para jsonify y request.get_json."""
+        
+        def dumps(self, obj: Any, **kwargs: Any) -> str:
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if kwargs.get('indent'):
+                option |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+        
+        def loads(self, s, **kwargs: Any) -> Any:
+            return orjson.loads(s)
+else:
+    OrjsonProvider = None
+
+def init_json_provider(app):
+    """
+    Configura la serialización JSON de la aplicación Flask.
+    
+    Usa orjson si está disponible; si no, al menos desactiva el
+    pretty-printing de las respuestas.
+    """
+    if OrjsonProvider is not None:
+        app.json = OrjsonProvider(app)
+        logger.info("Serialización JSON con orjson activada")
+    elif DefaultJSONProvider is not None:
+        app.json.compact = True
+    else:
+        app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+
+def _json_body() -> Any:
+    """
+    Cuerpo JSON de la petición, parseado directamente desde los bytes.
+    
+    Returns:
+        Los datos decodificados, o None si el cuerpo está vacío o no es JSON
+        válido (los endpoints responden 400 en ese caso)
+    """
+    body = request.get_data(cache=False)
+    if not body:
+        return None
+    try:
+        return orjson.loads(body) if ORJSON_AVAILABLE else json.loads(body)
+    except ValueError as e:
+        logger.warning("Cuerpo JSON inválido en %s: %s", request.path, e)
+        return None
+
+# Categorías de preferencias que el usuario puede ver y editar desde la web
+_EDITABLE_CATEGORIES = frozenset({
+    'usuario',
+    'contexto_cultural',
+    'mascotas',
+    'intereses',
+    'religion',
+    'ejemplos_personalizacion'
+})
+_EDITABLE_CATEGORIES_LIST = sorted(_EDITABLE_CATEGORIES)
+
+# La lista anterior ya serializada, para las respuestas 403
+_EDITABLE_CATEGORIES_JSON = (orjson.dumps(_EDITABLE_CATEGORIES_LIST) if ORJSON_AVAILABLE
+                             else json.dumps(_EDITABLE_CATEGORIES_LIST, separators=(',', ':')).encode('utf-8'))
+
+def _forbidden_category_response(error: str):
+    """Respuesta 403 para una categoría no editable, sin pasar por jsonify."""
+    error_json = orjson.dumps(error) if ORJSON_AVAILABLE else json.dumps(error).encode('utf-8')
+    body = (b'{"editable_categories":' + _EDITABLE_CATEGORIES_JSON +
+            b',"error":' + error_json + b',"success":false}\n')
+    return current_app.response_class(body, status=403, mimetype='application/json')
+
+# Conexiones SQLite abiertas por hilo (LRU); las menos usadas se cierran
+MAX_CACHED_CONNECTIONS = 32
+
+CONNECTION_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-64000;
+    PRAGMA mmap_size=268435456;
+"""
+
+_conn_cache = threading.local()
+
+def _get_conn(db_path) -> sqlite3.Connection:
+    """
+    Devuelve una conexión reutilizable (por hilo) a la BD indicada. Solo para
+    el registro del sistema: las BD de usuario se borran con delete_user y
+    una conexión cacheada seguiría leyendo el archivo eliminado.
+    
+    Args:
+        db_path: Ruta de la base de datos
+    """
+    conns = getattr(_conn_cache, 'conns', None)
+    if conns is None:
+        conns = _conn_cache.conns = OrderedDict()
+    
+    key = str(db_path)
+    conn = conns.get(key)
+    if conn is not None:
+        conns.move_to_end(key)
+        return conn
+    
+    conn = sqlite3.connect(key, check_same_thread=False, isolation_level=None)
+    conn.executescript(CONNECTION_PRAGMAS)
+    conns[key] = conn
+    
+    if len(conns) > MAX_CACHED_CONNECTIONS:
+        _, oldest = conns.popitem(last=False)
+        oldest.close()
+    return conn
+
+def _registry_version() -> tuple:
+    """
+    Huella del registro de usuarios: fecha de modificación de la BD y de su
+    WAL (en modo WAL las escrituras no tocan el archivo principal hasta el
+    checkpoint).
+    """
+    db_file = str(user_manager.system_path / "users_registry.db")
+    version = []
+    for path in (db_file, db_file + "-wal"):
+        try:
+            st = os.stat(path)
+            version.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            version.append(None)
+    return tuple(version)
+
+@lru_cache(maxsize=1)
+def _users_index(version: tuple) -> tuple:
+    """Lista de usuarios y su índice por nombre para una versión del registro."""
+    users = user_manager.get_users_list()
+    return users, {u['username']: u for u in users}
+
+def _users_list_cached() -> List[Dict[str, Any]]:
+    """Lista de usuarios cacheada mientras no cambie el registro (no modificar)."""
+    return _users_index(_registry_version())[0]
+
+def _users_by_name() -> Dict[str, Dict[str, Any]]:
+    """Usuarios indexados por nombre, cacheados igual que _users_list_cached."""
+    return _users_index(_registry_version())[1]
+
+# Archivo de señal que la aplicación principal consume al cambiar de usuario
+_SIGNAL_FILE = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'user_changed.flag'))
+_last_signal_payload = None
+
+def _write_signal_file(payload: str) -> bool:
+    """
+    Escribe el archivo de señal de forma atómica (archivo temporal + os.replace).
+    
+    Si la aplicación principal aún no ha consumido una señal con el mismo
+    contenido, no se vuelve a escribir.
+    
+    Returns:
+        bool: True si se escribió el archivo, False si no hacía falta
+    """
+    global _last_signal_payload
+    if payload == _last_signal_payload and os.path.exists(_SIGNAL_FILE):
+        return False
+    
+    tmp_file = _SIGNAL_FILE + ".tmp"
+    with open(tmp_file, 'w') as f:
+        f.write(payload)
+    os.replace(tmp_file, _SIGNAL_FILE)
+    _last_signal_payload = payload
+    return True
+
+def _latest_backup(username: str):
+    """
+    Backup más reciente del usuario (os.DirEntry) o None si no tiene.
+    
+    Recorre el directorio una sola vez; DirEntry.stat() queda cacheado.
+    """
+    prefix = f"{username}_"
+    latest = None
+    latest_mtime = None
+    with os.scandir(user_manager.backups_path) as entries:
+        for entry in entries:
+            name = entry.name
+            if name.startswith(prefix) and name.endswith('.zip'):
+                mtime = entry.stat().st_mtime
+                if latest is None or mtime > latest_mtime:
+                    latest, latest_mtime = entry, mtime
+    return latest
+
+@lru_cache(maxsize=1)
+def _count_backups_for(path: str, mtime_ns: int) -> int:
+    """Número de backups .zip en el directorio para una fecha de modificación."""
+    with os.scandir(path) as entries:
+        return sum(1 for entry in entries if entry.name.endswith('.zip'))
+
+def _count_backups() -> int:
+    """Número de backups, recalculado solo si cambia el directorio de backups."""
+    path = str(user_manager.backups_path)
+    return _count_backups_for(path, os.stat(path).st_mtime_ns)
+
+# Conteo de preferencias, recordatorios y contactos de la BD de un usuario
+SQL_COUNT_USER_DATA = """
+    SELECT (SELECT COUNT(*) FROM preferences),
+           (SELECT COUNT(*) FROM reminders),
+           (SELECT COUNT(*) FROM contacts)
+"""
+
+# Hilos para contar los datos de varios usuarios en paralelo (WAL permite
+# lectores concurrentes); pocos para no agotar descriptores de archivo
+COUNT_WORKERS = 4
+_COUNT_POOL = ThreadPoolExecutor(max_workers=COUNT_WORKERS, thread_name_prefix="user_api_count")
+
+def _count_user_data(username: str) -> Tuple[int, int, int]:
+    """
+    Cuenta preferencias, recordatorios y contactos en la BD del usuario.
+    
+    Returns:
+        Tuple (preferencias, recordatorios, contactos); ceros si la BD no
+        existe o no se puede leer
+    """
+    try:
+        db_path = user_manager.get_user_database_path(username)
+        if db_path.exists():
+            # Conexión de corta duración, cerrada al terminar (ver _get_conn)
+            with closing(sqlite3.connect(str(db_path))) as conn:
+                conn.execute("PRAGMA query_only = 1")
+                return conn.execute(SQL_COUNT_USER_DATA).fetchone()
+    except Exception as e:
+        logger.warning("Error contando datos para usuario %s: %s", username, e)
+    return 0, 0, 0
+
 # Crear Blueprint para las rutas de usuarios
 user_api = Blueprint('user_api', __name__, url_prefix='/api')
 
@@ -51,48 +297,33 @@ def list_users():
         JSON: Lista de usuarios con su información básica
     """
     try:
-        users = user_manager.get_users_list()
-        
-        # Agregar información adicional
-        for user in users:
-            user['is_current'] = (user['username'] == get_current_user())
-            
-            # Contar datos del usuario
-            try:
-                db_path = user_manager.get_user_database_path(user['username'])
-                if db_path.exists():
-                    import sqlite3
-                    with sqlite3.connect(db_path) as conn:
-                        cursor = conn.cursor()
-                        
-                        cursor.execute("SELECT COUNT(*) FROM preferences")
-                        user['preferences_count'] = cursor.fetchone()[0]
-                        
-                        cursor.execute("SELECT COUNT(*) FROM reminders")
-                        user['reminders_count'] = cursor.fetchone()[0]
-                        
-                        cursor.execute("SELECT COUNT(*) FROM contacts")
-                        user['contacts_count'] = cursor.fetchone()[0]
-                else:
-                    user['preferences_count'] = 0
-                    user['reminders_count'] = 0
-                    user['contacts_count'] = 0
-                    
-            except Exception as e:
-                logger.warning(f"Error contando datos para usuario {user['username']}: {e}")
-                user['preferences_count'] = 0
-                user['reminders_count'] = 0
-                user['contacts_count'] = 0
+        current_user = get_current_user()
+        base_users = user_manager.get_users_list()
+        # Conteos en paralelo; map conserva el orden de los usuarios
+        counts = _COUNT_POOL.map(_count_user_data, [user['username'] for user in base_users])
+        
+        # Agregar información adicional: cada usuario se construye de una vez
+        # con todos sus campos
+        users = [
+            {
+                **user,
+                'is_current': user['username'] == current_user,
+                'preferences_count': preferences_count,
+                'reminders_count': reminders_count,
+                'contacts_count': contacts_count
+            }
+            for user, (preferences_count, reminders_count, contacts_count) in zip(base_users, counts)
+        ]
         
         return jsonify({
             "success": True,
             "users": users,
-            "current_user": get_current_user(),
+            "current_user": current_user,
             "total_users": len(users)
         })
         
     except Exception as e:
-        logger.error(f"Error listando usuarios: {e}")
+        logger.error("Error listando usuarios: %s", e)
         return jsonify({
             "success": False,
             "error": "Error obteniendo lista de usuarios",
@@ -112,8 +343,7 @@ def get_current_user_info():
         current_user = get_current_user()
         
         # Obtener información básica del usuario
-        users = user_manager.get_users_list()
-        user_info = next((u for u in users if u['username'] == current_user), None)
+        user_info = _users_by_name().get(current_user)
         
         if not user_info:
             return jsonify({
@@ -121,24 +351,8 @@ def get_current_user_info():
                 "error": "Usuario actual no encontrado"
             }), 404
         
-        # Obtener solo las preferencias editables del usuario
-        all_preferences = get_user_preferences()
-        
-        # Filtrar solo las categorías editables
-        editable_categories = {
-            'usuario',
-            'contexto_cultural', 
-            'mascotas',
-            'intereses',
-            'religion',
-            'ejemplos_personalizacion'
-        }
-        
-        preferences = {
-            category: data 
-            for category, data in all_preferences.items() 
-            if category in editable_categories
-        }
+        # Obtener solo las preferencias editables del usuario (filtradas en SQL)
+        preferences = get_user_preferences(categories=_EDITABLE_CATEGORIES)
         
         # Agregar información del directorio
         user_dir = user_manager.get_user_directory(current_user)
@@ -164,7 +378,7 @@ def get_current_user_info():
         return jsonify(result)
         
     except Exception as e:
-        logger.error(f"Error obteniendo información del usuario actual: {e}")
+        logger.error("Error obteniendo información del usuario actual: %s", e)
         return jsonify({
             "success": False,
             "error": "Error obteniendo información del usuario",
@@ -189,7 +403,7 @@ def update_current_user():
         JSON: Resultado de la actualización
     """
     try:
-        data = request.get_json()
+        data = _json_body()
         if not data:
             return jsonify({
                 "success": False,
@@ -201,25 +415,20 @@ def update_current_user():
         # Actualizar display_name si se proporciona
         if 'display_name' in data:
             system_db_path = user_manager.system_path / "users_registry.db"
-            import sqlite3
             
-            with sqlite3.connect(system_db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    UPDATE users 
-                    SET display_name = ?, updated_at = CURRENT_TIMESTAMP 
-                    WHERE username = ?
-                """, (data['display_name'], current_user))
-                conn.commit()
+            _get_conn(system_db_path).execute("""
+                UPDATE users 
+                SET display_name = ?, updated_at = CURRENT_TIMESTAMP 
+                WHERE username = ?
+            """, (data['display_name'], current_user))
             
-            logger.info(f"Display name actualizado para {current_user}: {data['display_name']}")
+            _users_index.cache_clear()
+            logger.info("Display name actualizado para %s: %s", current_user, data['display_name'])
         
-        # Actualizar preferencias si se proporcionan
+        # Actualizar preferencias si se proporcionan (todas en una transacción)
         if 'preferences' in data and isinstance(data['preferences'], dict):
-            for category, prefs in data['preferences'].items():
-                success = set_user_preferences(category, prefs)
-                if not success:
-                    logger.warning(f"Error actualizando preferencias de categoría: {category}")
+            if data['preferences'] and not set_user_preferences_bulk(data['preferences']):
+                logger.warning("Error actualizando preferencias de categorías: %s", list(data['preferences']))
         
         return jsonify({
             "success": True,
@@ -228,7 +437,7 @@ def update_current_user():
         })
         
     except Exception as e:
-        logger.error(f"Error actualizando usuario actual: {e}")
+        logger.error("Error actualizando usuario actual: %s", e)
         return jsonify({
             "success": False,
             "error": "Error actualizando usuario",
@@ -251,7 +460,7 @@ def create_new_user():
         JSON: Resultado de la creación
     """
     try:
-        data = request.get_json()
+        data = _json_body()
         if not data:
             return jsonify({
                 "success": False,
@@ -275,10 +484,10 @@ def create_new_user():
             }), 400
         
         # Validar formato de username
-        if not username.replace('_', '').isalnum():
+        if _USERNAME_RE.match(username) is None:
             return jsonify({
                 "success": False,
-                "error": "El nombre de usuario solo puede contener letras, números y guiones bajos"
+                "error": "El nombre de usuario solo puede contener letras, números y guiones bajos (máximo 50 caracteres)"
             }), 400
         
         # Verificar que no existe
@@ -290,9 +499,10 @@ def create_new_user():
         
         # Crear usuario
         success = user_manager.create_user(username, display_name)
+        _users_index.cache_clear()
         
         if success:
-            logger.info(f"Usuario creado exitosamente: {username} ({display_name})")
+            logger.info("Usuario creado exitosamente: %s (%s)", username, display_name)
             return jsonify({
                 "success": True,
                 "message": f"Usuario '{username}' creado exitosamente",
@@ -308,7 +518,7 @@ def create_new_user():
             }), 500
         
     except Exception as e:
-        logger.error(f"Error creando usuario: {e}")
+        logger.error("Error creando usuario: %s", e)
         return jsonify({
             "success": False,
             "error": "Error interno creando usuario",
@@ -330,14 +540,15 @@ def switch_active_user():
         JSON: Resultado del cambio
     """
     try:
-        data = request.get_json()
+        data = _json_body()
         if not data:
             return jsonify({
                 "success": False,
                 "error": "No se proporcionó el usuario destino"
             }), 400
         
-        target_user = data.get('username', '').strip()
+        # Misma normalización que create_new_user
+        target_user = data.get('username', '').strip().lower()
         
         if not target_user:
             return jsonify({
@@ -347,34 +558,41 @@ def switch_active_user():
         
         current_user = get_current_user()
         
+        # Sin cambio real: no tocar la BD ni el archivo de señal
         if target_user == current_user:
             return jsonify({
                 "success": True,
                 "message": f"Ya eres el usuario activo: {target_user}"
             })
         
-        # Verificar que el usuario destino existe
-        if not user_manager.user_exists(target_user):
+        # Usuario inexistente: responder desde la lista cacheada, sin consultar la BD
+        target_info = _users_by_name().get(target_user)
+        if target_info is None or not target_info['is_active']:
             return jsonify({
                 "success": False,
                 "error": f"El usuario '{target_user}' no existe"
             }), 404
         
-        # Realizar el cambio
+        # Realizar el cambio (switch_user_context vuelve a verificar que el
+        # usuario existe; solo se consulta de nuevo si el cambio falla)
         success = switch_user_context(target_user)
+        _users_index.cache_clear()
+        
+        if not success and not user_manager.user_exists(target_user):
+            return jsonify({
+                "success": False,
+                "error": f"El usuario '{target_user}' no existe"
+            }), 404
         
         if success:
             # Crear archivo de señal para notificar a la aplicación principal
             try:
-                import os
-                signal_file = os.path.join(os.path.dirname(__file__), '..', 'user_changed.flag')
-                with open(signal_file, 'w') as f:
-                    f.write(f"{current_user}→{target_user}")
-                logger.info(f"Archivo de señal creado para cambio de usuario")
+                if _write_signal_file(f"{current_user}→{target_user}"):
+                    logger.info("Archivo de señal creado para cambio de usuario")
             except Exception as e:
-                logger.warning(f"No se pudo crear archivo de señal: {e}")
+                logger.warning("No se pudo crear archivo de señal: %s", e)
             
-            logger.info(f"Usuario cambiado exitosamente: {current_user} → {target_user}")
+            logger.info("Usuario cambiado exitosamente: %s → %s", current_user, target_user)
             return jsonify({
                 "success": True,
                 "message": f"Usuario cambiado de '{current_user}' a '{target_user}'",
@@ -390,7 +608,7 @@ def switch_active_user():
             }), 500
         
     except Exception as e:
-        logger.error(f"Error cambiando usuario: {e}")
+        logger.error("Error cambiando usuario: %s", e)
         return jsonify({
             "success": False,
             "error": "Error interno cambiando usuario",
@@ -431,9 +649,10 @@ def delete_user(username):
         
         # Eliminar usuario
         success = user_manager.delete_user(username)
+        _users_index.cache_clear()
         
         if success:
-            logger.info(f"Usuario eliminado exitosamente: {username}")
+            logger.info("Usuario eliminado exitosamente: %s", username)
             return jsonify({
                 "success": True,
                 "message": f"Usuario '{username}' eliminado exitosamente",
@@ -446,7 +665,7 @@ def delete_user(username):
             }), 500
         
     except Exception as e:
-        logger.error(f"Error eliminando usuario {username}: {e}")
+        logger.error("Error eliminando usuario %s: %s", username, e)
         return jsonify({
             "success": False,
             "error": "Error interno eliminando usuario",
@@ -466,16 +685,17 @@ def backup_user_data(username):
         JSON: Resultado del backup
     """
     try:
-        # Verificar que el usuario existe
-        if not user_manager.user_exists(username):
-            return jsonify({
-                "success": False,
-                "error": f"El usuario '{username}' no existe"
-            }), 404
-        
         # Solo permitir backup del usuario actual o ser admin (para futuras extensiones)
         current_user = get_current_user()
         if username != current_user:
+            # El usuario actual ya fue validado por require_user_context;
+            # solo hace falta consultar la existencia de otros usuarios
+            if not user_manager.user_exists(username):
+                return jsonify({
+                    "success": False,
+                    "error": f"El usuario '{username}' no existe"
+                }), 404
+            
             # Por ahora, solo permitir backup del usuario actual
             return jsonify({
                 "success": False,
@@ -487,8 +707,7 @@ def backup_user_data(username):
         
         if success:
             # Obtener lista de backups para mostrar el más reciente
-            backup_files = list(user_manager.backups_path.glob(f"{username}_*.zip"))
-            latest_backup = max(backup_files, key=lambda f: f.stat().st_mtime) if backup_files else None
+            latest_backup = _latest_backup(username)
             
             result = {
                 "success": True,
@@ -497,9 +716,10 @@ def backup_user_data(username):
             }
             
             if latest_backup:
+                st = latest_backup.stat()
                 result["backup_file"] = latest_backup.name
-                result["backup_size"] = latest_backup.stat().st_size
-                result["backup_created"] = datetime.fromtimestamp(latest_backup.stat().st_mtime).isoformat()
+                result["backup_size"] = st.st_size
+                result["backup_created"] = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(st.st_mtime))
             
             return jsonify(result)
         else:
@@ -509,7 +729,7 @@ def backup_user_data(username):
             }), 500
         
     except Exception as e:
-        logger.error(f"Error creando backup para {username}: {e}")
+        logger.error("Error creando backup para %s: %s", username, e)
         return jsonify({
             "success": False,
             "error": "Error interno creando backup",
@@ -529,36 +749,26 @@ def get_user_preferences_api():
         JSON: Categorías de preferencias editables del usuario
     """
     try:
-        # Categorías que pueden ser editadas por el usuario
-        editable_categories = {
-            'usuario',
-            'contexto_cultural', 
-            'mascotas',
-            'intereses',
-            'religion',
-            'ejemplos_personalizacion'
-        }
-        
         all_preferences = get_user_preferences()
         
         # Filtrar solo las categorías editables
         editable_preferences = {
             category: data 
             for category, data in all_preferences.items() 
-            if category in editable_categories
+            if category in _EDITABLE_CATEGORIES
         }
         
         return jsonify({
             "success": True,
             "user": get_current_user(),
             "preferences": editable_preferences,
-            "editable_categories": list(editable_categories),
+            "editable_categories": _EDITABLE_CATEGORIES_LIST,
             "total_categories": len(all_preferences),
             "shown_categories": len(editable_preferences)
         })
         
     except Exception as e:
-        logger.error(f"Error obteniendo preferencias: {e}")
+        logger.error("Error obteniendo preferencias: %s", e)
         return jsonify({
             "success": False,
             "error": "Error obteniendo preferencias",
@@ -579,23 +789,10 @@ def get_user_preference_category(category):
         JSON: Preferencias de la categoría especificada
     """
     try:
-        # Categorías que pueden ser leídas por el usuario
-        editable_categories = {
-            'usuario',
-            'contexto_cultural', 
-            'mascotas',
-            'intereses',
-            'religion',
-            'ejemplos_personalizacion'
-        }
-        
         # Verificar si la categoría es accesible
-        if category not in editable_categories:
-            return jsonify({
-                "success": False,
-                "error": f"La categoría '{category}' no es accesible desde la interfaz web",
-                "editable_categories": list(editable_categories)
-            }), 403
+        if category not in _EDITABLE_CATEGORIES:
+            return _forbidden_category_response(
+                f"La categoría '{category}' no es accesible desde la interfaz web")
         
         preferences = get_user_preferences(category)
         
@@ -607,7 +804,7 @@ def get_user_preference_category(category):
         })
         
     except Exception as e:
-        logger.error(f"Error obteniendo preferencias de categoría {category}: {e}")
+        logger.error("Error obteniendo preferencias de categoría %s: %s", category, e)
         return jsonify({
             "success": False,
             "error": f"Error obteniendo preferencias de categoría '{category}'",
@@ -630,25 +827,12 @@ def update_user_preference_category(category):
         JSON: Resultado de la actualización
     """
     try:
-        # Categorías que pueden ser editadas por el usuario
-        editable_categories = {
-            'usuario',
-            'contexto_cultural', 
-            'mascotas',
-            'intereses',
-            'religion',
-            'ejemplos_personalizacion'
-        }
-        
         # Verificar si la categoría es editable
-        if category not in editable_categories:
-            return jsonify({
-                "success": False,
-                "error": f"La categoría '{category}' no puede ser editada desde la interfaz web",
-                "editable_categories": list(editable_categories)
-            }), 403
+        if category not in _EDITABLE_CATEGORIES:
+            return _forbidden_category_response(
+                f"La categoría '{category}' no puede ser editada desde la interfaz web")
         
-        data = request.get_json()
+        data = _json_body()
         if not data:
             return jsonify({
                 "success": False,
@@ -672,7 +856,7 @@ def update_user_preference_category(category):
             }), 500
         
     except Exception as e:
-        logger.error(f"Error actualizando preferencias de categoría {category}: {e}")
+        logger.error("Error actualizando preferencias de categoría %s: %s", category, e)
         return jsonify({
             "success": False,
             "error": f"Error actualizando preferencias de categoría '{category}'",
@@ -689,12 +873,12 @@ def get_system_status():
         JSON: Estado del sistema y estadísticas
     """
     try:
-        users = user_manager.get_users_list()
+        users = _users_list_cached()
         current_user = get_current_user()
         
         # Calcular estadísticas
         total_users = len(users)
-        active_users = len([u for u in users if u['is_active']])
+        active_users = sum(1 for u in users if u['is_active'])
         
         # Información del sistema
         system_info = {
@@ -708,8 +892,7 @@ def get_system_status():
         }
         
         # Contar backups
-        backup_files = list(user_manager.backups_path.glob("*.zip"))
-        system_info["total_backups"] = len(backup_files)
+        system_info["total_backups"] = _count_backups()
         
         return jsonify({
             "success": True,
@@ -718,7 +901,7 @@ def get_system_status():
         })
         
     except Exception as e:
-        logger.error(f"Error obteniendo estado del sistema: {e}")
+        logger.error("Error obteniendo estado del sistema: %s", e)
         return jsonify({
             "success": False,
             "error": "Error obteniendo estado del sistema",
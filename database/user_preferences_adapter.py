@@ -15,8 +15,10 @@ Fecha: 2024-08-18
 Versión: 1.0.0
 """
 
+import copy
 import logging
 import json
+import time
 from typing import Dict, Any, Optional
 from datetime import datetime
 
@@ -24,6 +26,165 @@ from .models.user_manager import user_manager
 
 logger = logging.getLogger(__name__)
 
+# Segundos que se reutilizan las preferencias convertidas aunque la BD no cambie
+CACHE_TTL = 30
+
+# Categorías personales (BD del usuario), con el mismo nombre en formato IA
+_PERSONAL_KEYS = (
+    'usuario', 'intereses', 'mascotas', 'contexto_cultural',
+    'religion', 'ejemplos_personalizacion'
+)
+
+# Categorías técnicas (desde las preferencias por defecto), iguales para todos los usuarios
+_TECHNICAL_KEYS = (
+    'comunicacion', 'configuracion_ai', 'asistente', 'ia_generativa',
+    'comandos_clasicos', 'filtros_contenido', 'aprendizaje',
+    'integracion_sistema', 'horarios_disponibilidad', 'contexto_asistente'
+)
+
+_ALL_COPY_KEYS = _PERSONAL_KEYS + _TECHNICAL_KEYS
+
+# Preferencias de fallback sin los campos de fecha; cada llamada devuelve
+# una copia de sus categorías
+_FALLBACK_TEMPLATE = {
+    'usuario': {
+        'nombre': 'Usuario',
+        'edad': 25,
+        'ciudad': '',
+        'timezone': 'America/Guayaquil',
+        'idioma_preferido': 'es',
+        'modo_verbose': False
+    },
+    'intereses': {
+        'hobbies_principales': [],
+        'plantas_conoce': [],
+        'comidas_favoritas': [],
+        'entretenimiento': [],
+        'musica_preferida': [],
+        'actividades_sociales': []
+    },
+    'mascotas': {
+        'tiene_mascotas': False,
+        'tipo': '',
+        'nombres': []
+    },
+    'contexto_cultural': {
+        'pais': '',
+        'region': '',
+        'tradiciones_conoce': []
+    },
+    'religion': {
+        'practica': False,
+        'tipo': ''
+    },
+    'ejemplos_personalizacion': {
+        'frases_cercanas': [],
+        'cuando_hablar_comida': {'contexto': '', 'incluir': []},
+        'cuando_hablar_entretenimiento': {'contexto': '', 'incluir': []},
+        'cuando_hablar_mascotas': {'contexto': '', 'incluir': []},
+        'cuando_hablar_plantas': {'contexto': '', 'incluir': []}
+    },
+    'comunicacion': {
+        'temas_conversacion_favoritos': [],
+        'estilo_respuesta': 'amigable_personal',
+        'incluir_referencias_personales': True,
+        'nivel_detalle': 'medio'
+    },
+    'asistente': {
+        'personalidad': 'amigable_profesional',
+        'usar_emojis': False,
+        'respuestas_cortas': True,
+        'confirmacion_antes_acciones': True
+    },
+    'contexto_asistente': {
+        'soy_asistente_kata': True,
+        'ejecuto_en': 'raspberry_pi_5',
+        'mis_capacidades': [
+            'recordatorios_medicacion',
+            'gestion_tareas',
+            'contactos_emergencia',
+            'control_dispositivos',
+            'respuestas_inteligentes'
+        ],
+        'ubicacion': 'hogar_usuario',
+        'proposito': 'asistencia_personal_integral'
+    },
+    'configuracion_ai': {
+        'usar_generativa': True,
+        'personalizar_respuestas': True,
+        'incluir_nombres_mascotas': True,
+        'mencionar_intereses': True,
+        'estilo_conversacion': 'cercano_respetuoso',
+        'complejidad_maxima': 3,
+        'timeout_respuesta': 30
+    },
+    'ia_generativa': {
+        'habilitada': False,
+        'proveedor_preferido': 'gemini',
+        'modelo_backup': 'gpt-3.5-turbo',
+        'confianza_minima_clasica': 0.85,
+        'max_tokens_respuesta': 150,
+        'temperatura': 0.3,
+        'usar_contexto_conversacion': True,
+        'recordar_preferencias': True
+    },
+    'comandos_clasicos': {
+        'siempre_preferir': [
+            'recordatorio', 'medicacion', 'contacto_emergencia',
+            'fecha', 'hora', 'enchufe'
+        ],
+        'nunca_derivar_ia': [
+            'emergencia', 'medicacion_critica', 'sistema_apagar'
+        ]
+    }
+}
+
+
+# Categorías mínimas requeridas por ContextEnricher, usadas cuando faltan en
+# la BD. Cada conversión usa una copia de la categoría
+_DEFAULT_USUARIO = {
+    'edad': 25,
+    'ciudad': '',
+    'timezone': 'America/Guayaquil',
+    'idioma_preferido': 'es',
+    'modo_verbose': False
+}
+
+_REQUIRED_DEFAULTS = {
+    'asistente': {
+        'personalidad': 'amigable_profesional',
+        'usar_emojis': False,
+        'respuestas_cortas': True,
+        'confirmacion_antes_acciones': True
+    },
+    'contexto_asistente': {
+        'soy_asistente_kata': True,
+        'ejecuto_en': 'raspberry_pi_5',
+        'mis_capacidades': [
+            'recordatorios_medicacion',
+            'gestion_tareas',
+            'contactos_emergencia',
+            'control_dispositivos',
+            'respuestas_inteligentes'
+        ],
+        'ubicacion': 'hogar_usuario',
+        'proposito': 'asistencia_personal_integral'
+    },
+    'comunicacion': {
+        'temas_conversacion_favoritos': [
+            'recuerdos_juventud',
+            'familia_nietos',
+            'cocina_recetas',
+            'consejos_vida',
+            'cosas_casa_familia'
+        ],
+        'estilo_respuesta': 'amigable_personal',
+        'incluir_referencias_personales': True,
+        'nivel_detalle': 'medio'
+    }
+}
+
+
 class UserPreferencesAdapter:
     """
     Adaptador que convierte datos de BD multi-usuario al formato
@@ -34,7 +195,8 @@ class UserPreferencesAdapter:
         """Inicializa el adaptador con cache para optimización."""
         self._cached_user = None
         self._cached_preferences = None
-        self._last_update = None
+        self._cached_mtime = None
+        self._cache_expiry = 0.0
         
         logger.info("UserPreferencesAdapter inicializado")
     
@@ -56,8 +218,10 @@ class UserPreferencesAdapter:
                 logger.warning("No hay usuario activo, usando configuración por defecto")
                 return self._get_fallback_preferences()
             
-            # Verificar cache
-            if self._is_cache_valid(target_user):
+            # Verificar cache (la huella se toma antes de leer la BD para no
+            # asociar datos viejos a una escritura posterior)
+            mtime = user_manager.get_user_preferences_mtime(target_user)
+            if self._is_cache_valid(target_user, mtime):
                 logger.debug(f"Usando cache para usuario: {target_user}")
                 return self._cached_preferences
             
@@ -65,7 +229,7 @@ class UserPreferencesAdapter:
             user_preferences = self._load_and_convert_preferences(target_user)
             
             # Actualizar cache
-            self._update_cache(target_user, user_preferences)
+            self._update_cache(target_user, user_preferences, mtime)
             
             return user_preferences
             
@@ -73,26 +237,32 @@ class UserPreferencesAdapter:
             logger.error(f"Error obteniendo preferencias para IA: {e}")
             return self._get_fallback_preferences()
     
-    def _is_cache_valid(self, username: str) -> bool:
-        """Verifica si el cache es válido para el usuario dado."""
+    def _is_cache_valid(self, username: str, mtime: tuple) -> bool:
+        """
+        Verifica si el cache es válido para el usuario dado: no ha expirado y
+        la BD del usuario no se ha modificado desde que se cargó.
+        """
         return (
             self._cached_user == username and 
             self._cached_preferences is not None and
-            self._last_update is not None
+            time.monotonic() < self._cache_expiry and
+            self._cached_mtime == mtime
         )
     
-    def _update_cache(self, username: str, preferences: Dict[str, Any]):
+    def _update_cache(self, username: str, preferences: Dict[str, Any], mtime: tuple):
         """Actualiza el cache con nuevas preferencias."""
         self._cached_user = username
         self._cached_preferences = preferences
-        self._last_update = datetime.now()
+        self._cached_mtime = mtime
+        self._cache_expiry = time.monotonic() + CACHE_TTL
         logger.debug(f"Cache actualizado para usuario: {username}")
     
     def clear_cache(self):
         """Limpia el cache forzando recarga en próxima consulta."""
         self._cached_user = None
         self._cached_preferences = None
-        self._last_update = None
+        self._cached_mtime = None
+        self._cache_expiry = 0.0
         logger.debug("Cache limpiado")
     
     def _load_and_convert_preferences(self, username: str) -> Dict[str, Any]:
@@ -114,7 +284,7 @@ class UserPreferencesAdapter:
                 return self._get_fallback_preferences()
             
             # Convertir formato BD → formato IA
-            ai_preferences = self._convert_to_ai_format(user_prefs, username)
+            ai_preferences = self._build_ai_format(user_prefs, username)
             
             logger.info(f"Preferencias convertidas para IA - Usuario: {username}")
             return ai_preferences
@@ -123,10 +293,13 @@ class UserPreferencesAdapter:
             logger.error(f"Error cargando preferencias de BD para {username}: {e}")
             return self._get_fallback_preferences()
     
-    def _convert_to_ai_format(self, user_prefs: Dict[str, Any], username: str) -> Dict[str, Any]:
+    def _build_ai_format(self, user_prefs: Dict[str, Any], username: str) -> Dict[str, Any]:
         """
         Convierte preferencias de BD al formato esperado por ContextEnricher.
         
+        En un solo recorrido copia las categorías, completa las mínimas
+        requeridas y reemplaza los None por ''.
+        
         Args:
             user_prefs: Preferencias desde BD (6 personales + 13 técnicas)
             username: Nombre del usuario
@@ -134,248 +307,71 @@ class UserPreferencesAdapter:
         Returns:
             Dict: Preferencias en formato ContextEnricher
         """
-        # Estructura base que espera ContextEnricher
         ai_format = {}
+        pending = []
         
-        # === MAPEO DE CATEGORÍAS PERSONALES (BD → IA) ===
-        
-        # 1. usuario → usuario (directo)
-        if 'usuario' in user_prefs:
-            ai_format['usuario'] = user_prefs['usuario'].copy()
-        
-        # 2. intereses → intereses (directo)
-        if 'intereses' in user_prefs:
-            ai_format['intereses'] = user_prefs['intereses'].copy()
-        
-        # 3. mascotas → mascotas (directo)
-        if 'mascotas' in user_prefs:
-            ai_format['mascotas'] = user_prefs['mascotas'].copy()
-        
-        # 4. contexto_cultural → contexto_cultural (directo)
-        if 'contexto_cultural' in user_prefs:
-            ai_format['contexto_cultural'] = user_prefs['contexto_cultural'].copy()
-        
-        # 5. religion → religion (directo)
-        if 'religion' in user_prefs:
-            ai_format['religion'] = user_prefs['religion'].copy()
-        
-        # 6. ejemplos_personalizacion → ejemplos_personalizacion (directo)
-        if 'ejemplos_personalizacion' in user_prefs:
-            ai_format['ejemplos_personalizacion'] = user_prefs['ejemplos_personalizacion'].copy()
-        
-        # === CATEGORÍAS TÉCNICAS (desde default_preferences.json) ===
+        # Categorías personales y técnicas. Cada dict se copia antes de
+        # limpiarlo: las técnicas son los dicts de las preferencias por defecto
+        # de UserManager, compartidas por todos los usuarios, y el resultado se
+        # cachea y se entrega a quien lo pida
+        for key in _ALL_COPY_KEYS:
+            if key in user_prefs:
+                value = user_prefs[key]
+                if value is None:
+                    value = ''
+                elif value.__class__ is dict:
+                    value = dict(value)
+                    pending.append(value)
+                ai_format[key] = value
+            elif key == 'usuario':
+                ai_format[key] = {'nombre': username.title(), **_DEFAULT_USUARIO}
+            elif key in _REQUIRED_DEFAULTS:
+                # Ya están limpias: basta una copia, sin recorrerlas
+                ai_format[key] = dict(_REQUIRED_DEFAULTS[key])
         
-        # Estas categorías vienen del archivo técnico y son iguales para todos los usuarios
-        technical_categories = [
-            'comunicacion', 'configuracion_ai', 'asistente', 'ia_generativa',
-            'comandos_clasicos', 'filtros_contenido', 'aprendizaje',
-            'integracion_sistema', 'horarios_disponibilidad', 'contexto_asistente'
-        ]
-        
-        for category in technical_categories:
-            if category in user_prefs:
-                ai_format[category] = user_prefs[category].copy()
-        
-        # === CATEGORÍAS DE METADATOS ===
-        
-        # Agregar metadatos del usuario y sistema
-        ai_format.update({
-            'version_config': user_prefs.get('version_config', '1.0.0'),
-            'fecha_creacion': user_prefs.get('fecha_creacion', datetime.now().strftime('%Y-%m-%d')),
-            'ultima_actualizacion': datetime.now().strftime('%Y-%m-%d')
-        })
-        
-        # === VERIFICACIONES Y LIMPIEZA ===
+        # Metadatos del usuario y sistema
+        today = datetime.now().strftime('%Y-%m-%d')
+        ai_format['version_config'] = user_prefs.get('version_config', '1.0.0')
+        ai_format['fecha_creacion'] = user_prefs.get('fecha_creacion', today)
+        ai_format['ultima_actualizacion'] = today
+        for key in ('version_config', 'fecha_creacion'):
+            if ai_format[key] is None:
+                ai_format[key] = ''
         
-        # Asegurar que existen las categorías mínimas requeridas
-        ai_format = self._ensure_required_categories(ai_format, username)
+        # Reemplazar None por '' en los niveles inferiores, copiando también
+        # cada dict anidado antes de modificarlo
+        while pending:
+            obj = pending.pop()
+            for key, value in obj.items():
+                if value is None:
+                    obj[key] = ''
+                elif value.__class__ is dict:
+                    obj[key] = value = dict(value)
+                    pending.append(value)
         
-        # Limpiar y validar datos
-        ai_format = self._clean_and_validate(ai_format)
+        # Asegurar que edad es un número
+        user_data = ai_format['usuario']
+        if user_data.__class__ is dict and 'edad' in user_data:
+            try:
+                user_data['edad'] = int(user_data['edad']) if user_data['edad'] else 25
+            except (ValueError, TypeError):
+                user_data['edad'] = 25
         
         logger.debug(f"Conversión BD→IA completada. Categorías: {len(ai_format)}")
         return ai_format
     
-    def _ensure_required_categories(self, prefs: Dict[str, Any], username: str) -> Dict[str, Any]:
-        """Asegura que existen las categorías mínimas requeridas por ContextEnricher."""
-        
-        # Categorías mínimas requeridas por ContextEnricher
-        if 'usuario' not in prefs:
-            prefs['usuario'] = {
-                'nombre': username.title(),
-                'edad': 25,
-                'ciudad': '',
-                'timezone': 'America/Guayaquil',
-                'idioma_preferido': 'es',
-                'modo_verbose': False
-            }
-        
-        if 'asistente' not in prefs:
-            prefs['asistente'] = {
-                'personalidad': 'amigable_profesional',
-                'usar_emojis': False,
-                'respuestas_cortas': True,
-                'confirmacion_antes_acciones': True
-            }
-        
-        if 'contexto_asistente' not in prefs:
-            prefs['contexto_asistente'] = {
-                'soy_asistente_kata': True,
-                'ejecuto_en': 'raspberry_pi_5',
-                'mis_capacidades': [
-                    'recordatorios_medicacion',
-                    'gestion_tareas', 
-                    'contactos_emergencia',
-                    'control_dispositivos',
-                    'respuestas_inteligentes'
-                ],
-                'ubicacion': 'hogar_usuario',
-                'proposito': 'asistencia_personal_integral'
-            }
-        
-        if 'comunicacion' not in prefs:
-            prefs['comunicacion'] = {
-                'temas_conversacion_favoritos': [
-                    'recuerdos_juventud',
-                    'familia_nietos',
-                    'cocina_recetas', 
-                    'consejos_vida',
-                    'cosas_casa_familia'
-                ],
-                'estilo_respuesta': 'amigable_personal',
-                'incluir_referencias_personales': True,
-                'nivel_detalle': 'medio'
-            }
-        
-        return prefs
-    
-    def _clean_and_validate(self, prefs: Dict[str, Any]) -> Dict[str, Any]:
-        """Limpia y valida los datos de preferencias."""
-        
-        # Asegurar que las listas vacías no sean None
-        def clean_lists(obj):
-            if isinstance(obj, dict):
-                return {k: clean_lists(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return obj if obj else []
-            elif obj is None:
-                return ''
-            else:
-                return obj
-        
-        cleaned_prefs = clean_lists(prefs)
-        
-        # Validaciones específicas
-        if 'usuario' in cleaned_prefs:
-            user_data = cleaned_prefs['usuario']
-            # Asegurar que edad es un número
-            if 'edad' in user_data:
-                try:
-                    user_data['edad'] = int(user_data['edad']) if user_data['edad'] else 25
-                except (ValueError, TypeError):
-                    user_data['edad'] = 25
-        
-        return cleaned_prefs
-    
     def _get_fallback_preferences(self) -> Dict[str, Any]:
         """
         Retorna preferencias por defecto en caso de error.
         Basado en las preferencias mínimas que espera ContextEnricher.
         """
+        today = datetime.now().strftime('%Y-%m-%d')
+        # Copia profunda: la plantilla tiene listas y dicts anidados
         return {
-            'usuario': {
-                'nombre': 'Usuario',
-                'edad': 25,
-                'ciudad': '',
-                'timezone': 'America/Guayaquil',
-                'idioma_preferido': 'es',
-                'modo_verbose': False
-            },
-            'intereses': {
-                'hobbies_principales': [],
-                'plantas_conoce': [],
-                'comidas_favoritas': [],
-                'entretenimiento': [],
-                'musica_preferida': [],
-                'actividades_sociales': []
-            },
-            'mascotas': {
-                'tiene_mascotas': False,
-                'tipo': '',
-                'nombres': []
-            },
-            'contexto_cultural': {
-                'pais': '',
-                'region': '',
-                'tradiciones_conoce': []
-            },
-            'religion': {
-                'practica': False,
-                'tipo': ''
-            },
-            'ejemplos_personalizacion': {
-                'frases_cercanas': [],
-                'cuando_hablar_comida': {'contexto': '', 'incluir': []},
-                'cuando_hablar_entretenimiento': {'contexto': '', 'incluir': []},
-                'cuando_hablar_mascotas': {'contexto': '', 'incluir': []},
-                'cuando_hablar_plantas': {'contexto': '', 'incluir': []}
-            },
-            'comunicacion': {
-                'temas_conversacion_favoritos': [],
-                'estilo_respuesta': 'amigable_personal',
-                'incluir_referencias_personales': True,
-                'nivel_detalle': 'medio'
-            },
-            'asistente': {
-                'personalidad': 'amigable_profesional',
-                'usar_emojis': False,
-                'respuestas_cortas': True,
-                'confirmacion_antes_acciones': True
-            },
-            'contexto_asistente': {
-                'soy_asistente_kata': True,
-                'ejecuto_en': 'raspberry_pi_5',
-                'mis_capacidades': [
-                    'recordatorios_medicacion',
-                    'gestion_tareas',
-                    'contactos_emergencia',
-                    'control_dispositivos',
-                    'respuestas_inteligentes'
-                ],
-                'ubicacion': 'hogar_usuario',
-                'proposito': 'asistencia_personal_integral'
-            },
-            'configuracion_ai': {
-                'usar_generativa': True,
-                'personalizar_respuestas': True,
-                'incluir_nombres_mascotas': True,
-                'mencionar_intereses': True,
-                'estilo_conversacion': 'cercano_respetuoso',
-                'complejidad_maxima': 3,
-                'timeout_respuesta': 30
-            },
-            'ia_generativa': {
-                'habilitada': False,
-                'proveedor_preferido': 'gemini',
-                'modelo_backup': 'gpt-3.5-turbo',
-                'confianza_minima_clasica': 0.85,
-                'max_tokens_respuesta': 150,
-                'temperatura': 0.3,
-                'usar_contexto_conversacion': True,
-                'recordar_preferencias': True
-            },
-            'comandos_clasicos': {
-                'siempre_preferir': [
-                    'recordatorio', 'medicacion', 'contacto_emergencia',
-                    'fecha', 'hora', 'enchufe'
-                ],
-                'nunca_derivar_ia': [
-                    'emergencia', 'medicacion_critica', 'sistema_apagar'
-                ]
-            },
+            **copy.deepcopy(_FALLBACK_TEMPLATE),
             'version_config': '1.0.0',
-            'fecha_creacion': datetime.now().strftime('%Y-%m-%d'),
-            'ultima_actualizacion': datetime.now().strftime('%Y-%m-%d')
+            'fecha_creacion': today,
+            'ultima_actualizacion': today
         }
     
     def get_user_summary(self, username: str = None) -> Dict[str, Any]:
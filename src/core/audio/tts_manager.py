@@ -1,6 +1,4 @@
 # tts_manager.py (Corregido y listo para personalización)
-import os
-import uuid
 import subprocess
 import logging
 import threading
@@ -20,7 +18,6 @@ except Exception as e:
     logger.warning(f"No se pudo inicializar Google Cloud TTS: {e}")
     logger.info("TTS funcionará en modo degradado (síntesis por espeak si está disponible)")
     _client = None
-TMP_DIR = "/tmp"
 DEFAULT_VOICE = "es-US-Neural2-A"
 
 def speak_with_espeak(text: str, speed: int = 150, voice: str = "es"):
@@ -113,7 +110,6 @@ def say(text: str, voice_name: str = None):
     """Genera y reproduce audio usando una voz específica."""
     selected_voice = voice_name if voice_name else DEFAULT_VOICE
     language_code = "-".join(selected_voice.split("-")[:2])
-    filename = None
     
     # LIMPIAR TEXTO PARA TTS
     cleaned_text = clean_text_for_tts(text)
@@ -139,20 +135,14 @@ def say(text: str, voice_name: str = None):
         audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3)
         response = _client.synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
         
-        # 2. Guardar archivo temporal
-        filename = os.path.join(TMP_DIR, f"tts_{uuid.uuid4().hex}.mp3")
-        with open(filename, "wb") as out:
-            out.write(response.audio_content)
-        
-        logger.info(f"TTS: Archivo de audio creado: {filename}")
-        
-        # 3. Reproducir con timeout para evitar bloqueos
+        # 2. Reproducir con timeout para evitar bloqueos. mpg123 lee el MP3
+        # desde stdin ("-"), sin pasar por un archivo temporal
         logger.info("TTS: Iniciando reproducción con mpg123...")
         result = subprocess.run(
-            ["mpg123", "-q", filename], 
+            ["mpg123", "-q", "-"], 
+            input=response.audio_content,
             timeout=30,  # Timeout de 30 segundos
-            capture_output=True,
-            text=True
+            capture_output=True
         )
         
         if result.returncode == 0:
@@ -160,7 +150,7 @@ def say(text: str, voice_name: str = None):
         else:
             logger.warning(f"TTS: mpg123 terminó con código {result.returncode}")
             if result.stderr:
-                logger.warning(f"TTS: Error de mpg123: {result.stderr}")
+                logger.warning(f"TTS: Error de mpg123: {result.stderr.decode(errors='replace')}")
                 
     except subprocess.TimeoutExpired:
         logger.error("TTS_ERROR: Timeout en reproducción de audio (30s) - mpg123 no respondió")
@@ -172,14 +162,6 @@ def say(text: str, voice_name: str = None):
         logger.error(f"TTS_ERROR: No se pudo generar o reproducir el audio. Error: {e}")
         
     finally:
-        # Limpiar archivo temporal siempre
-        if filename and os.path.exists(filename):
-            try:
-                os.remove(filename)
-                logger.debug(f"TTS: Archivo temporal eliminado: {filename}")
-            except Exception as e:
-                logger.warning(f"TTS: No se pudo eliminar archivo temporal {filename}: {e}")
-                
         logger.info("TTS: Proceso TTS finalizado")
 
 def say_async(text: str, voice_name: str = None):
@@ -391,21 +373,15 @@ class StreamingTTSManager:
     
     def _play_audio_data(self, audio_data: bytes, text: str):
         """Reproduce audio data directamente"""
-        filename = None
         try:
-            # Crear archivo temporal
-            filename = os.path.join(TMP_DIR, f"streaming_tts_{uuid.uuid4().hex}.mp3")
-            with open(filename, "wb") as f:
-                f.write(audio_data)
-            
             logger.debug(f"StreamingTTS: Reproduciendo: '{text[:30]}...'")
             
-            # Reproducir con mpg123
+            # Reproducir con mpg123, leyendo el MP3 desde stdin
             result = subprocess.run(
-                ["mpg123", "-q", filename], 
+                ["mpg123", "-q", "-"], 
+                input=audio_data,
                 timeout=10,
-                capture_output=True,
-                text=True
+                capture_output=True
             )
             
             if result.returncode == 0:
@@ -417,13 +393,6 @@ class StreamingTTSManager:
             logger.error("StreamingTTS: Timeout en reproducción de audio")
         except Exception as e:
             logger.error(f"StreamingTTS: Error reproduciendo audio: {e}")
-        finally:
-            # Limpiar archivo temporal
-            if filename and os.path.exists(filename):
-                try:
-                    os.remove(filename)
-                except Exception as e:
-                    logger.warning(f"StreamingTTS: No se pudo eliminar {filename}: {e}")
 
 # Instancia global del streaming TTS
 _streaming_tts = StreamingTTSManager()
@@ -16,10 +16,14 @@ import time
 import os
 import requests
 import json
-from typing import List, Dict, Any, Optional, Callable
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional, Callable, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Segundos máximos que se espera a que la BD confirme un mensaje encolado
+MESSAGE_SAVE_TIMEOUT = 10.0
+
 class MessageReceiver:
     """Receptor de mensajes de Telegram"""
     
@@ -135,8 +139,15 @@ class MessageReceiver:
                 updates = self._get_updates()
                 
                 if updates:
+                    # Encolar toda la tanda primero para que se guarde en una
+                    # sola transacción, y después notificar cada mensaje
+                    pending = []
                     for update in updates:
-                        self._process_update(update)
+                        queued = self._process_update(update)
+                        if queued:
+                            pending.append(queued)
+                    for future, message_data in pending:
+                        self._finish_message(future, message_data)
                         
                 # Pausa entre verificaciones
                 time.sleep(2)  # Verificar cada 2 segundos
@@ -187,9 +198,9 @@ class MessageReceiver:
             logger.error(f"MessageReceiver: Error obteniendo actualizaciones: {e}")
             return []
     
-    def _process_update(self, update: Dict[str, Any]):
+    def _process_update(self, update: Dict[str, Any]) -> Optional[Tuple[Future, Dict[str, Any]]]:
         """
-        Procesa una actualización de Telegram
+        Procesa una actualización de Telegram y encola su mensaje en BD
         
         Args:
             update (Dict): Actualización de Telegram
@@ -211,35 +222,50 @@ class MessageReceiver:
             # Determinar nombre del contacto
             contact_name = self._get_contact_name(message['from'], chat_id)
             
-            # Guardar mensaje en BD
+            # Encolar mensaje en BD (se guarda junto con el resto de la tanda)
             if self.db_manager:
-                message_id = self.db_manager.add_message(
+                future = self.db_manager.add_message_async(
                     contact_name=contact_name,
                     message_text=message_text,
                     telegram_message_id=telegram_message_id,
                     sender_chat_id=chat_id
                 )
                 
-                if message_id > 0:
-                    logger.info(f"MessageReceiver: Nuevo mensaje guardado - ID: {message_id}, De: {contact_name}")
-                    
-                    # Notificar a callbacks
-                    message_data = {
-                        'id': message_id,
-                        'contact_name': contact_name,
-                        'message_text': message_text,
-                        'chat_id': chat_id,
-                        'telegram_message_id': telegram_message_id
-                    }
-                    
-                    self._notify_callbacks(message_data)
-                else:
-                    logger.error("MessageReceiver: Error guardando mensaje en BD")
+                message_data = {
+                    'contact_name': contact_name,
+                    'message_text': message_text,
+                    'chat_id': chat_id,
+                    'telegram_message_id': telegram_message_id
+                }
+                return future, message_data
             else:
                 logger.error("MessageReceiver: BD no disponible para guardar mensaje")
                 
         except Exception as e:
             logger.error(f"MessageReceiver: Error procesando actualización: {e}")
+        return None
+    
+    def _finish_message(self, future: Future, message_data: Dict[str, Any]):
+        """
+        Espera a que se guarde un mensaje encolado y notifica a los callbacks
+        
+        Args:
+            future (Future): Resultado de add_message_async
+            message_data (Dict): Datos del mensaje (sin ID todavía)
+        """
+        try:
+            message_id = future.result(timeout=MESSAGE_SAVE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"MessageReceiver: Error esperando guardado de mensaje: {e}")
+            return
+        
+        if message_id > 0:
+            logger.info(f"MessageReceiver: Nuevo mensaje guardado - ID: {message_id}, De: {message_data['contact_name']}")
+            
+            # Notificar a callbacks
+            self._notify_callbacks({'id': message_id, **message_data})
+        else:
+            logger.error("MessageReceiver: Error guardando mensaje en BD")
     
     def _get_contact_name(self, from_user: Dict[str, Any], chat_id: str) -> str:
         """
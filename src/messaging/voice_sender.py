@@ -17,12 +17,29 @@ Autor: Asistente Kata
 import logging
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Callable, Dict, Any, List
 import requests
 import os
 
 logger = logging.getLogger(__name__)
 
+# Envíos simultáneos como máximo al alertar a los contactos de emergencia
+ALERT_WORKERS = 4
+
+# Sesión HTTP compartida con la API de Telegram: conserva las conexiones
+# abiertas entre mensajes y alertas. Se crea en el primer envío
+_telegram_session: Optional[requests.Session] = None
+_telegram_session_lock = threading.Lock()
+
+def _get_telegram_session() -> requests.Session:
+    """Devuelve la sesión HTTP compartida, creándola la primera vez."""
+    global _telegram_session
+    with _telegram_session_lock:
+        if _telegram_session is None:
+            _telegram_session = requests.Session()
+        return _telegram_session
+
 class VoiceMessageSender:
     """Sistema de envío de mensajes por voz con feedback inmediato"""
     
@@ -388,7 +405,7 @@ class VoiceMessageSender:
                 'parse_mode': 'HTML'
             }
             
-            response = requests.post(url, json=payload, timeout=10)
+            response = _get_telegram_session().post(url, json=payload, timeout=10)
             
             if response.status_code == 200:
                 result = response.json()
@@ -469,18 +486,22 @@ class VoiceMessageSender:
 ⚠️ Han pasado más de 5 minutos sin confirmación.
 Por favor, verifica que esté bien."""
             
-            # Enviar a todos los contactos de emergencia
-            alerts_sent = 0
-            for contact in emergency_contacts:
+            def send_alert(contact) -> bool:
                 try:
                     chat_id = contact['telegram_chat_id']
                     if chat_id and self._send_telegram_message(chat_id, alert_message):
-                        alerts_sent += 1
                         logger.info(f"VoiceMessageSender: Alerta enviada a {contact['display_name']} ({chat_id})")
-                    else:
-                        logger.warning(f"VoiceMessageSender: No se pudo enviar a {contact['display_name']} - chat_id: {chat_id}")
+                        return True
+                    logger.warning(f"VoiceMessageSender: No se pudo enviar a {contact['display_name']} - chat_id: {chat_id}")
                 except Exception as e:
                     logger.error(f"VoiceMessageSender: Error enviando a {contact['display_name']}: {e}")
+                return False
+            
+            # Enviar a todos los contactos de emergencia a la vez: la alerta no
+            # espera a que termine el envío al contacto anterior
+            workers = min(ALERT_WORKERS, len(emergency_contacts))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                alerts_sent = sum(pool.map(send_alert, emergency_contacts))
             
             logger.info(f"VoiceMessageSender: {alerts_sent}/{len(emergency_contacts)} alertas de medicamento enviadas exitosamente")
             return alerts_sent > 0
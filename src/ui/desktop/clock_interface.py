@@ -146,17 +146,14 @@ class ClockInterface(ctk.CTkFrame):
                 from database.models.shared_data_manager import shared_data_manager
                 
                 # Contar mensajes no leídos existentes
-                with shared_data_manager.get_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT COUNT(*) FROM received_messages WHERE is_read = 0")
-                    unread_count = cursor.fetchone()[0]
-                    
-                    if unread_count > 0:
-                        # Actualizar la UI con el conteo existente
-                        self.update_message_count(unread_count)
-                        logger.info(f"CLOCK_INTERFACE: Cargados {unread_count} mensajes no leídos al iniciar")
-                    else:
-                        logger.debug("CLOCK_INTERFACE: No hay mensajes no leídos pendientes")
+                unread_count = shared_data_manager.get_unread_message_count()
+                
+                if unread_count > 0:
+                    # Actualizar la UI con el conteo existente
+                    self.update_message_count(unread_count)
+                    logger.info(f"CLOCK_INTERFACE: Cargados {unread_count} mensajes no leídos al iniciar")
+                else:
+                    logger.debug("CLOCK_INTERFACE: No hay mensajes no leídos pendientes")
                         
             except ImportError as e:
                 logger.warning(f"CLOCK_INTERFACE: No se pudo cargar gestor de BD para mensajes iniciales: {e}")
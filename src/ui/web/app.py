@@ -29,7 +29,7 @@ sys.path.append(database_path)
 
 try:
     from database.models.user_context import user_context_middleware, require_user_context
-    from database.user_api import user_api
+    from database.user_api import user_api, init_json_provider
     from database.models.reminders_adapter import reminders_adapter
     MULTI_USER_AVAILABLE = True
     logging.info("Sistema multi-usuario cargado correctamente")
@@ -62,6 +62,9 @@ if MULTI_USER_AVAILABLE:
     # Registrar Blueprint de APIs de usuario
     app.register_blueprint(user_api)
     
+    # Serializar las respuestas JSON con orjson (si está instalado)
+    init_json_provider(app)
+    
     logging.info("Sistema multi-usuario configurado en Flask")
 else:
     logging.warning("Aplicación Flask ejecutándose SIN sistema multi-usuario")